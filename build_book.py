@@ -0,0 +1,41 @@
+"""
+Build an opening book of model.book from PDN game collections, or look up a position in it.
+
+    python build_book.py book.bin games.pdn more_games.pdn --plies 12 --min-games 3
+    python build_book.py book.bin --probe "W:B1,2,3,4,5,6,7,8,9,10,11,12:W21,22,23,24,25,26,27,28,29,30,31,32"
+"""
+import argparse
+import itertools as it
+import sys
+import time
+
+from model.book import OpeningBook, build
+from model.pdn import read_file, PDN_SIDES
+from model.records import from_fen
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Build or probe an opening book.")
+    parser.add_argument('book')
+    parser.add_argument('games', nargs='*', help="PDN files")
+    parser.add_argument('--plies', type=int, default=12, help="plies of every game counted in the book")
+    parser.add_argument('--min-games', type=int, default=1, help="moves played less often are left out")
+    parser.add_argument('-w', '--workers', type=int, default=None, help="processes validating games")
+    parser.add_argument('--probe', metavar='FEN', help="position in the FEN tag form of PDN")
+    args = parser.parse_args(argv)
+
+    if args.probe:
+        with OpeningBook(args.book) as book:
+            for book_move in book.probe(*from_fen(args.probe, PDN_SIDES)):
+                print(book_move)
+        return 0
+
+    start = time.perf_counter()
+    records = it.chain.from_iterable(read_file(path, args.workers, skip_invalid=True) for path in args.games)
+    entries = build(records, args.book, args.plies, args.min_games)
+    print(f"{entries} entries, time: {time.perf_counter() - start:.1f} s")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,45 @@
+"""
+Build endgame tables of model.tablebase, or look up a position in them.
+
+    python build_tablebase.py tables -p 3
+    python build_tablebase.py tables --probe 0x00000001 0x00000000 0x00000000 0x00030000 --red
+"""
+import argparse
+import sys
+import time
+
+from model.bitboard import BitBoard
+from model.items import Player
+from model.tablebase import Tablebase, build, WIN, LOSS
+
+RESULTS = {WIN: 'win', LOSS: 'loss'}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Build or probe endgame tables.")
+    parser.add_argument('directory')
+    parser.add_argument('-p', '--pieces', type=int, default=3, help="maximal number of pieces on the board")
+    parser.add_argument('--probe', nargs=4, metavar='MASK', type=lambda mask: int(mask, 0),
+                        help="white men, red men, white kings and red kings masks of a BitBoard")
+    parser.add_argument('--red', action='store_true', help="red is to move in the probed position")
+    args = parser.parse_args(argv)
+
+    if args.probe:
+        tablebase = Tablebase(args.directory)
+        probe = tablebase.probe(BitBoard(*args.probe), Player.red if args.red else Player.white)
+        tablebase.close()
+        if probe is None:
+            print("not in the tables")
+            return 1
+        result, distance = probe
+        print(f"{RESULTS[result]} in {distance} plies" if result in RESULTS else "draw")
+        return 0
+
+    start = time.perf_counter()
+    build(args.directory, args.pieces)
+    print(f"time: {time.perf_counter() - start:.1f} s")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
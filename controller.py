@@ -1,12 +1,20 @@
 from model.game import Game
+from model.pdn import format_move
 from terminalView import *
 
 
 class Controller:
-    def __init__(self):
-        self.game = Game()
+    def __init__(self, engine=None, engine_player=Player.red, size=8, starting_rows=3):
+        """
+        :param engine: model.engine.Engine playing against the human player, None for two human players.
+        :param engine_player: Player of the engine.
+        :param size: of the board, the engine plays only on the 8x8 board.
+        """
+        self.game = Game(size=size, starting_rows=starting_rows)
         self.dialog = Dialog()
         self.last_destination = None
+        self.engine = engine
+        self.engine_player = engine_player
 
     def start_game(self):
         self.dialog.show_intro()
@@ -16,13 +24,27 @@ class Controller:
         with self.game:
             while self.game.continues():
                 possible_moves = self.game.get_possible_moves()
+                if self.engine is not None and self.game.current_player == self.engine_player:
+                    self._engine_move()
+                    continue
                 selected_move = self._get_next_move(possible_moves)
                 self.game.move(selected_move)
                 self.last_destination = selected_move.dest
 
+        if self.engine is not None:
+            self.engine.stop()
         self._print_board()
         self.dialog.show_ending(self.game.winner)
 
+    def _engine_move(self):
+        move = self.engine.choose(self.game)
+        text = format_move(move)
+        self.game.play(move)
+        self.last_destination = None
+        self.dialog.show_engine_move(self.engine_player, text, self.engine.clock.remaining)
+        # thinks while the human player is choosing a move
+        self.engine.ponder(self.game)
+
     def _get_next_move(self, possible_moves):
         # fixme: duplicated ids when king and piece available
         id_field_translator = IdFieldTranslator(possible_moves)
@@ -38,7 +60,7 @@ class Controller:
         movable_pieces = translator.pieces_dict()
 
         if self._is_continuation(movable_pieces):
-            return translator.id_to_piece('a')
+            return translator.id_to_piece(list(movable_pieces.values())[0])
         else:
             self._print_board(movable_pieces)
             piece_id = self.dialog.get_piece(movable_pieces.values())
@@ -73,7 +95,8 @@ class IdFieldTranslator:
     def _moves(self, piece):
         moves = self.possible_moves[piece]
         destinations = [move.dest for move in moves]
-        ids = '123456789ABCDEFG'
+        # a king in the middle of the 10x10 board reaches 17 fields
+        ids = '123456789ABCDEFGHIJ'
 
         return zip(destinations, ids)
 
@@ -117,12 +140,20 @@ class Dialog:
         self.select_single_destination_msg = "Now please enter destination id or just click Enter."
         self.exit_confirmation_msg = "Are you sure you want to exit?"
         self.end_suffix = " player is the winner! Congratulations!!"
+        self.draw_msg = "The game is a draw."
+        self.engine_move_msg = "{} plays {}, {:.0f} s left on its clock."
 
     def show_intro(self):
         print(self.intro_msg)
 
     def show_ending(self, player):
-        print(player.name.capitalize(), self.end_suffix)
+        if player is None:
+            print(self.draw_msg)
+        else:
+            print(player.name.capitalize(), self.end_suffix)
+
+    def show_engine_move(self, player, move, remaining):
+        print(self.engine_move_msg.format(player.name.capitalize(), move, remaining))
 
     #todo: refactor below...
 
@@ -0,0 +1,202 @@
+"""
+Batched move generation with NumPy.
+
+BatchBoard keeps many independent 8x8 positions as an (N, 4) uint32 array of BitBoard masks
+(white men, red men, white kings, red kings) and an (N,) bool array telling where red is to move.
+Its kernels shift all positions at once:
+
+    - capture_flags() - where a capture is forced,
+    - quiet_moves() - legal-move masks of positions without a capture, (N, PLANES, 32) bool,
+      plane p holds destinations of men moving in direction p (p < 4)
+      or of kings sliding (p - 4) % 7 + 1 squares in direction (p - 4) // 7,
+    - step() - next positions after one chosen move in each of them.
+
+Capture sequences follow the longest-capture rule, which does not vectorize well, so positions
+with a forced capture are advanced one by one with BitBoard.
+"""
+import numpy as np
+
+from model.bitboard import BitBoard, SHIFTS, PROMOTION_ROW, MAN_DIRECTIONS, DIRECTIONS
+from model.items import Player
+from model.rays import RAYS, SQUARES
+
+MAN_PLANES = len(DIRECTIONS)
+KING_DISTANCE = 7
+PLANES = MAN_PLANES + len(DIRECTIONS) * KING_DISTANCE
+
+_SHIFTS = [[(delta, np.uint32(sources)) for delta, sources in SHIFTS[d]] for d in DIRECTIONS]
+_BITS = np.arange(SQUARES, dtype=np.uint32)
+_FORWARD = np.array([[d in MAN_DIRECTIONS[player] for d in DIRECTIONS] for player in (Player.white, Player.red)])
+_PROMOTION = np.array([PROMOTION_ROW[Player.white], PROMOTION_ROW[Player.red]], dtype=np.uint32)
+
+
+def _build_sources():
+    """_SOURCES[plane, dest] -> square the piece moves from, -1 when there is none."""
+    sources = np.full((PLANES, SQUARES), -1, dtype=np.int64)
+    for d in DIRECTIONS:
+        back = (d + 2) % 4
+        for dest in range(SQUARES):
+            ray = RAYS[back][dest]
+            if ray:
+                sources[d, dest] = ray[0]
+            for distance in range(1, len(ray) + 1):
+                sources[MAN_PLANES + d * KING_DISTANCE + distance - 1, dest] = ray[distance - 1]
+    return sources
+
+
+_SOURCES = _build_sources()
+
+
+def shift(masks, direction):
+    """Vectorized model.bitboard.shift."""
+    result = np.zeros_like(masks)
+    for delta, sources in _SHIFTS[direction]:
+        bits = masks & sources
+        result |= bits << np.uint32(delta) if delta > 0 else bits >> np.uint32(-delta)
+    return result
+
+
+def bits(masks):
+    """Expands (...) uint32 masks to (..., 32) bool."""
+    return (masks[..., None] >> _BITS & 1).astype(bool)
+
+
+class BatchBoard:
+    def __init__(self, masks, red_to_move):
+        """
+        :param masks: (N, 4) uint32 array, see BitBoard.masks().
+        :param red_to_move: (N,) bool array.
+        """
+        self.masks = np.asarray(masks, dtype=np.uint32)
+        self.red_to_move = np.asarray(red_to_move, dtype=bool)
+
+    @classmethod
+    def initial(cls, n):
+        masks = np.tile(np.array(BitBoard.initial().masks(), dtype=np.uint32), (n, 1))
+        return cls(masks, np.zeros(n, dtype=bool))
+
+    @classmethod
+    def from_positions(cls, positions):
+        """:param positions: iterable of (BitBoard, Player) pairs."""
+        positions = list(positions)
+        masks = np.array([position.masks() for position, _ in positions], dtype=np.uint32).reshape(-1, 4)
+        return cls(masks, np.array([player == Player.red for _, player in positions], dtype=bool))
+
+    def __len__(self):
+        return len(self.masks)
+
+    def position(self, i):
+        """:return: (BitBoard, Player) of i-th position."""
+        player = Player.red if self.red_to_move[i] else Player.white
+        return BitBoard(*(int(mask) for mask in self.masks[i])), player
+
+    def _sides(self):
+        red = self.red_to_move
+        m = self.masks
+        own_men = np.where(red, m[:, 1], m[:, 0])
+        own_kings = np.where(red, m[:, 3], m[:, 2])
+        opponent = np.where(red, m[:, 0] | m[:, 2], m[:, 1] | m[:, 3])
+        empty = ~(m[:, 0] | m[:, 1] | m[:, 2] | m[:, 3])
+        return own_men, own_kings, opponent, empty
+
+    def capture_flags(self):
+        """(N,) bool, True where the player to move has to capture."""
+        own_men, own_kings, opponent, empty = self._sides()
+        flags = np.zeros(len(self), dtype=bool)
+
+        for d in DIRECTIONS:
+            reach = slide = own_kings
+            for _ in range(KING_DISTANCE):
+                slide = shift(slide, d) & empty
+                reach = reach | slide
+
+            victims = shift(own_men | reach, d) & opponent
+            flags |= (shift(victims, d) & empty) != 0
+        return flags
+
+    def quiet_moves(self):
+        """(N, PLANES, 32) bool legal-move masks, rows of positions with a forced capture are all False."""
+        own_men, own_kings, _, empty = self._sides()
+        planes = np.zeros((len(self), PLANES), dtype=np.uint32)
+
+        forward = _FORWARD[self.red_to_move.astype(np.int64)]
+        for d in DIRECTIONS:
+            planes[:, d] = np.where(forward[:, d], shift(own_men, d) & empty, 0)
+
+            slide = own_kings
+            for distance in range(KING_DISTANCE):
+                slide = shift(slide, d) & empty
+                planes[:, MAN_PLANES + d * KING_DISTANCE + distance] = slide
+
+        planes[self.capture_flags()] = 0
+        return bits(planes)
+
+    def step(self, planes, dests, rows=None):
+        """
+        Next positions after a quiet move in each of rows, side to move is switched there.
+        :param planes, dests: chosen move of each row, as indices into quiet_moves().
+        :param rows: indices of positions to advance, all by default.
+        :return: new BatchBoard.
+        """
+        rows = np.arange(len(self)) if rows is None else np.asarray(rows)
+        planes, dests = np.asarray(planes), np.asarray(dests)
+        masks = self.masks.copy()
+        red = self.red_to_move[rows].astype(np.int64)
+
+        src_bits = np.uint32(1) << _SOURCES[planes, dests].astype(np.uint32)
+        dest_bits = np.uint32(1) << dests.astype(np.uint32)
+
+        is_king = planes >= MAN_PLANES
+        promoted = ~is_king & ((dest_bits & _PROMOTION[red]) != 0)
+
+        masks[rows, np.where(is_king, 2 + red, red)] ^= src_bits
+        masks[rows, np.where(is_king | promoted, 2 + red, red)] |= dest_bits
+
+        red_to_move = self.red_to_move.copy()
+        red_to_move[rows] = ~red_to_move[rows]
+        return BatchBoard(masks, red_to_move)
+
+    def random_step(self, random_state):
+        """
+        Advance every position by a random legal move.
+        :param random_state: numpy.random.RandomState
+        :return: (new BatchBoard, (N,) bool array of positions with no legal move, left unchanged).
+        """
+        legal = self.quiet_moves().reshape(len(self), -1)
+        counts = legal.sum(axis=1)
+        captures = self.capture_flags()
+
+        rows = np.nonzero(counts)[0]
+        choice = (random_state.random_sample(len(rows)) * counts[rows]).astype(np.int64)
+        chosen = np.argmax(np.cumsum(legal[rows], axis=1) > choice[:, None], axis=1)
+        result = self.step(chosen // SQUARES, chosen % SQUARES, rows)
+
+        for i in np.nonzero(captures)[0]:
+            position, player = self.position(i)
+            moves = position.generate(player)
+            position = position.apply(moves[random_state.randint(len(moves))], player)
+            result.masks[i] = position.masks()
+            result.red_to_move[i] = not self.red_to_move[i]
+
+        return result, (counts == 0) & ~captures
+
+
+def play_out(batch, random_state, max_plies=200):
+    """
+    Random games from every position of the batch, in lockstep.
+    :return: (N,) int8 array, 1 where white won, -1 where red won, 0 when max_plies were not enough.
+    """
+    result = np.zeros(len(batch), dtype=np.int8)
+    running = np.ones(len(batch), dtype=bool)
+
+    for _ in range(max_plies):
+        if not running.any():
+            break
+        batch, finished = batch.random_step(random_state)
+
+        finished &= running
+        # the player to move has no legal move and loses
+        result[finished] = np.where(batch.red_to_move[finished], 1, -1)
+        running &= ~finished
+
+    return result
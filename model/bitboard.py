@@ -0,0 +1,468 @@
+"""
+Bitboard position engine.
+
+A position is kept as four 32-bit masks (white men, red men, white kings, red kings),
+one bit per playable square. Squares are numbered row by row:
+
+        ;  0 ;    ;  1 ;    ;  2 ;    ;  3
+      4 ;    ;  5 ;    ;  6 ;    ;  7 ;
+        ;  8 ;    ;  9 ;    ; 10 ;    ; 11
+     12 ;    ; 13 ;    ; 14 ;    ; 15 ;
+        ; 16 ;    ; 17 ;    ; 18 ;    ; 19
+     20 ;    ; 21 ;    ; 22 ;    ; 23 ;
+        ; 24 ;    ; 25 ;    ; 26 ;    ; 27
+     28 ;    ; 29 ;    ; 30 ;    ; 31 ;
+
+A move is a tuple (path, captured): path holds visited squares starting with the moved piece's
+square, captured holds squares of captured pieces in capture order (empty for quiet moves).
+
+Boards of other sizes are numbered the same way, row by row, and have BitBoard classes of their own,
+see BitBoard.of_size(): 10x10 masks have 50 bits. Module level constants, pack() and the modules built
+on top of BitBoard, evaluation, search, tablebases and records, are those of the 8x8 board.
+"""
+from collections import OrderedDict
+
+from model import rays, zobrist
+from model.items import Player, Move, EndGameEvent
+from model.rays import SQUARES, NEIGHBOURS, RAYS
+
+DIRECTIONS = rays.DIRECTIONS['nwse']
+MAN_DIRECTIONS = {player: rays.DIRECTIONS[player.value] for player in Player}
+
+
+def _build_shifts(neighbours):
+    shifts = tuple({} for _ in DIRECTIONS)
+
+    for d in DIRECTIONS:
+        for square, neighbour in enumerate(neighbours[d]):
+            if neighbour != -1:
+                delta = neighbour - square
+                shifts[d][delta] = shifts[d].get(delta, 0) | 1 << square
+
+    return tuple(tuple(s.items()) for s in shifts)
+
+
+def _promotion_rows(geometry):
+    row = (1 << geometry.rows // 2) - 1
+    return {Player.white: row << (geometry.squares - geometry.rows // 2), Player.red: row}
+
+
+SHIFTS = _build_shifts(NEIGHBOURS)
+
+FULL = (1 << SQUARES) - 1
+PROMOTION_ROW = _promotion_rows(rays.STANDARD)
+
+
+def shift(mask, direction, shifts=SHIFTS):
+    """
+    Moves every bit of mask one step in direction, bits falling off the board are dropped.
+    :param shifts: of the board, BitBoard.SHIFTS of its size.
+    """
+    result = 0
+    for delta, sources in shifts[direction]:
+        bits = mask & sources
+        result |= bits << delta if delta > 0 else bits >> -delta
+    return result
+
+
+def count(mask):
+    return bin(mask).count('1')
+
+
+def squares(mask):
+    """Yields set squares of mask in ascending order."""
+    while mask:
+        low = mask & -mask
+        yield low.bit_length() - 1
+        mask ^= low
+
+
+_SQUARE_BITS = (SQUARES - 1).bit_length()
+_SQUARE_MASK = (1 << _SQUARE_BITS) - 1
+
+
+def pack(move):
+    """
+    Move of the 8x8 board packed into an int: number of visited squares in the lowest 4 bits, then the squares.
+    Captured pieces are not stored, in a given position they follow from the visited squares.
+    """
+    path = move[0]
+    packed = len(path)
+    for i, square in enumerate(path):
+        packed |= square << (4 + _SQUARE_BITS * i)
+    return packed
+
+
+def unpack(packed):
+    """:return: squares visited by the packed move."""
+    return tuple(packed >> (4 + _SQUARE_BITS * i) & _SQUARE_MASK for i in range(packed & 0xF))
+
+
+class BitBoard:
+    """Position of the 8x8 board, of_size() gives the class of positions of another size."""
+
+    __slots__ = ('white_men', 'red_men', 'white_kings', 'red_kings')
+    # the board, replaced in classes of other sizes
+    SIZE = rays.ROWS
+    STARTING_ROWS = 3
+    FULL = FULL
+    SHIFTS = SHIFTS
+    RAYS = RAYS
+    NEIGHBOURS = NEIGHBOURS
+    PROMOTION_ROW = PROMOTION_ROW
+    KEYS = zobrist.keys(SQUARES)
+
+    def __init__(self, white_men=0, red_men=0, white_kings=0, red_kings=0):
+        self.white_men = white_men
+        self.red_men = red_men
+        self.white_kings = white_kings
+        self.red_kings = red_kings
+
+    @staticmethod
+    def of_size(size):
+        """:return: BitBoard class of positions of the size x size board, built once."""
+        cls = _classes.get(size)
+        if cls is None:
+            geometry = rays.geometry(size)
+            cls = _classes[size] = type(f'BitBoard{size}', (BitBoard,), {
+                '__slots__': (), 'SIZE': size, 'STARTING_ROWS': size // 2 - 1,
+                'FULL': (1 << geometry.squares) - 1, 'SHIFTS': _build_shifts(geometry.neighbours),
+                'RAYS': geometry.rays, 'NEIGHBOURS': geometry.neighbours,
+                'PROMOTION_ROW': _promotion_rows(geometry), 'KEYS': zobrist.keys(geometry.squares)})
+        return cls
+
+    @classmethod
+    def initial(cls, starting_rows=None):
+        """:param starting_rows: rows of men of every player, STARTING_ROWS by default."""
+        men = (1 << (starting_rows or cls.STARTING_ROWS) * cls.SIZE // 2) - 1
+        return cls(white_men=men, red_men=men << (cls.FULL.bit_length() - men.bit_length()))
+
+    @staticmethod
+    def from_board(board):
+        """:return: position of the Board, of the class of its size."""
+        return BitBoard.of_size(board.size)(*board.masks)
+
+    def __reduce__(self):
+        return _from_masks, (self.SIZE, self.masks())
+
+    def __eq__(self, other):
+        return isinstance(other, BitBoard) and self.SIZE == other.SIZE and self.masks() == other.masks()
+
+    def __hash__(self):
+        return hash(self.masks())
+
+    def __repr__(self):
+        return "BitBoard(0x{:08x}, 0x{:08x}, 0x{:08x}, 0x{:08x})".format(*self.masks())
+
+    def masks(self):
+        return self.white_men, self.red_men, self.white_kings, self.red_kings
+
+    def men(self, player):
+        return self.white_men if player == Player.white else self.red_men
+
+    def kings(self, player):
+        return self.white_kings if player == Player.white else self.red_kings
+
+    def pieces(self, player):
+        return self.men(player) | self.kings(player)
+
+    @property
+    def occupied(self):
+        return self.white_men | self.red_men | self.white_kings | self.red_kings
+
+    def key(self, player, square=None):
+        """Zobrist key computed from scratch, the same as Board.key of the same position."""
+        return self.KEYS.masks_key(self.masks(), player == Player.red, square)
+
+    def next_key(self, key, move, player):
+        """Zobrist key of the position after move, updated incrementally from key of this position."""
+        path, captured = move
+        src, dest = path[0], path[-1]
+        red = player == Player.red
+
+        keys = self.KEYS
+        pieces = keys.pieces
+
+        kind = zobrist.RED_MAN if red else zobrist.WHITE_MAN
+        if self.kings(player) >> src & 1:
+            kind += 2
+            new_kind = kind
+        elif 1 << dest & self.PROMOTION_ROW[player]:
+            new_kind = kind + 2
+        else:
+            new_kind = kind
+        key ^= pieces[kind][src] ^ pieces[new_kind][dest] ^ keys.side
+
+        opponent_kings = self.kings(player.opponent)
+        opponent_man = zobrist.WHITE_MAN if red else zobrist.RED_MAN
+        for square in captured:
+            key ^= pieces[opponent_man + 2 * (opponent_kings >> square & 1)][square]
+        return key
+
+    def generate(self, player, square=None):
+        """
+        Legal moves of player. Captures are forced and only the longest capture sequences are returned.
+        :param square: restrict generation to the piece standing on that square.
+        :return: list of (path, captured) tuples, pieces in ascending square order.
+        """
+        sources = self.pieces(player)
+        if square is not None:
+            sources &= 1 << square
+
+        captures = self._captures(player, sources)
+        if captures:
+            return captures
+        return self._moves(player, sources)
+
+    def has_capture(self, player, square=None):
+        """True when player has to capture, stops at the first capture found."""
+        sources = self.pieces(player)
+        if square is not None:
+            sources &= 1 << square
+        opponent = self.pieces(player.opponent)
+        empty = self.FULL ^ self.occupied
+
+        if self._men_jumpers(self.men(player) & sources, opponent, empty):
+            return True
+
+        all_rays = self.RAYS
+        for king in squares(self.kings(player) & sources):
+            for d in DIRECTIONS:
+                ray = all_rays[d][king]
+                for i, target in enumerate(ray):
+                    if empty >> target & 1:
+                        continue
+                    if opponent >> target & 1 and i + 1 < len(ray) and empty >> ray[i + 1] & 1:
+                        return True
+                    break
+        return False
+
+    def has_move(self, player, square=None):
+        """True when player has any legal move, stops as soon as one is found."""
+        sources = self.pieces(player)
+        if square is not None:
+            sources &= 1 << square
+        empty = self.FULL ^ self.occupied
+
+        if self._men_movers(player, self.men(player) & sources, empty):
+            return True
+        kings = self.kings(player) & sources
+        if any(shift(kings, d, self.SHIFTS) & empty for d in DIRECTIONS):
+            return True
+        return self.has_capture(player, square)
+
+    def iter_moves(self, player, square=None):
+        """
+        Legal moves of player, the same as generate(). Quiet moves are produced one by one,
+        captures are all found first, since only the longest ones are legal.
+        """
+        sources = self.pieces(player)
+        if square is not None:
+            sources &= 1 << square
+
+        if self.has_capture(player, square):
+            yield from self._captures(player, sources)
+        else:
+            yield from self._iter_moves(player, sources)
+
+    def is_legal(self, player, path, square=None):
+        """
+        :param path: squares visited by the moved piece, starting with its own square.
+        :param square: square of the piece which has to continue its capture.
+        """
+        if square is not None and path[0] != square:
+            return False
+        # moves of all pieces, a capture or a longer capture of another piece makes the path illegal
+        return any(move[0] == path for move in self.iter_moves(player, square))
+
+    def apply(self, move, player):
+        """Returns position after the complete move. A man ending its move on the last row is crowned."""
+        path, captured = move
+        src, dest = 1 << path[0], 1 << path[-1]
+
+        removed = 0
+        for square in captured:
+            removed |= 1 << square
+        keep = self.FULL ^ removed
+        promotion_row = self.PROMOTION_ROW[player]
+
+        white_men, red_men = self.white_men & keep, self.red_men & keep
+        white_kings, red_kings = self.white_kings & keep, self.red_kings & keep
+
+        # src and dest are the same square when a king's capture ends where it started
+        if player == Player.white:
+            if white_kings & src:
+                white_kings = white_kings ^ src | dest
+            elif dest & promotion_row:
+                white_men ^= src
+                white_kings |= dest
+            else:
+                white_men = white_men ^ src | dest
+        else:
+            if red_kings & src:
+                red_kings = red_kings ^ src | dest
+            elif dest & promotion_row:
+                red_men ^= src
+                red_kings |= dest
+            else:
+                red_men = red_men ^ src | dest
+
+        return self.__class__(white_men, red_men, white_kings, red_kings)
+
+    def _men_jumpers(self, men, opponent, empty):
+        jumpers = 0
+        shifts = self.SHIFTS
+        for d in DIRECTIONS:
+            back = (d + 2) % 4
+            jumpers |= shift(shift(empty, back, shifts) & opponent, back, shifts)
+        return men & jumpers
+
+    def _men_movers(self, player, men, empty):
+        movers = 0
+        for d in MAN_DIRECTIONS[player]:
+            movers |= shift(empty, (d + 2) % 4, self.SHIFTS)
+        return men & movers
+
+    def _captures(self, player, sources):
+        opponent = self.pieces(player.opponent)
+        kings = self.kings(player) & sources
+        empty = self.FULL ^ self.occupied
+        men = self._men_jumpers(self.men(player) & sources, opponent, empty)
+
+        longest = [0, []]
+        for square in squares(men | kings):
+            is_king = bool(kings >> square & 1)
+            _capture_sequences(square, is_king, opponent, empty | 1 << square, (square,), (), longest, self.RAYS)
+
+        return longest[1]
+
+    def _moves(self, player, sources):
+        return list(self._iter_moves(player, sources))
+
+    def _iter_moves(self, player, sources):
+        empty = self.FULL ^ self.occupied
+        kings = self.kings(player) & sources
+        men = self._men_movers(player, self.men(player) & sources, empty)
+        man_dirs = MAN_DIRECTIONS[player]
+        all_rays, neighbours = self.RAYS, self.NEIGHBOURS
+
+        for square in squares(men | kings):
+            if kings >> square & 1:
+                for d in DIRECTIONS:
+                    for dest in all_rays[d][square]:
+                        if not empty >> dest & 1:
+                            break
+                        yield (square, dest), ()
+            else:
+                for d in man_dirs:
+                    dest = neighbours[d][square]
+                    if dest != -1 and empty >> dest & 1:
+                        yield (square, dest), ()
+
+
+def _capture_sequences(square, is_king, opponent, empty, path, captured, longest, all_rays=RAYS):
+    """
+    Depth first search of capture sequences starting at square.
+    Captured pieces are removed from the board immediately and a man is not crowned in the middle of a sequence.
+    Square of the capturing piece is always treated as empty.
+    :param longest: [length, moves] of the longest sequences found so far, shorter ones are dropped when they end.
+    :param all_rays: of the board, BitBoard.RAYS of its size.
+    """
+    is_extended = False
+    for d in DIRECTIONS:
+        ray = all_rays[d][square]
+        if not is_king:
+            ray = ray[:2]
+
+        victim = -1
+        for i, target in enumerate(ray):
+            bit = 1 << target
+            if victim == -1:
+                if empty & bit:
+                    if is_king:
+                        continue
+                    break
+                if not opponent & bit or i + 1 == len(ray):
+                    break
+                victim = target
+                continue
+
+            if not empty & bit:
+                break
+
+            is_extended = True
+            victim_bit = 1 << victim
+            _capture_sequences(target, is_king, opponent ^ victim_bit, empty | victim_bit,
+                               path + (target,), captured + (victim,), longest, all_rays)
+
+            if not is_king:
+                break
+
+    if not is_extended and captured:
+        if len(captured) > longest[0]:
+            longest[0], longest[1] = len(captured), []
+        if len(captured) == longest[0]:
+            longest[1].append((path, captured))
+
+
+_classes = {BitBoard.SIZE: BitBoard}
+
+
+def _from_masks(size, masks):
+    return BitBoard.of_size(size)(*masks)
+
+
+class BitboardMovesGenerator:
+    """
+    Drop-in replacement of MovesGenerator backed by BitBoard.
+    Produces the same dictionary of {piece: [Move, ...]} for the given Board.
+    """
+
+    def __init__(self, player, board, piece=None, tablebase=None):
+        self.player = player
+        self.board = board
+        self.specific_piece = piece
+        self.tablebase = tablebase
+
+    def generate(self):
+        position = BitBoard.from_board(self.board)
+        square = self.specific_piece.square if self.specific_piece else None
+
+        if self.tablebase is not None and square is None:
+            from model.tablebase import adjudicate
+            adjudicate(self.tablebase, self.board, self.player)
+
+        moves = position.generate(self.player, square)
+        if not moves:
+            raise EndGameEvent(self.player.opponent)
+
+        return to_moves(self.board, moves)
+
+
+def to_moves(board, moves):
+    """
+    Moves of the Board given as (path, captured) tuples.
+    :return: dictionary of {piece: [Move, ...]}, the same as MovesGenerator.generate() returns.
+    """
+    all_moves = OrderedDict()
+
+    for move in moves:
+        move = to_move(board, move)
+        all_moves.setdefault(move.piece, []).append(move)
+
+    return all_moves
+
+
+def to_move(board, move):
+    """:return: Move of the Board with its following moves, given as a (path, captured) tuple."""
+    path, captured = move
+    fields = board()
+    # the object board may be of any size
+    addr = board.geometry.square_addr
+    piece = fields[addr(path[0])]
+
+    following_move = None
+    for i in range(len(path) - 1, 0, -1):
+        captured_piece = fields[addr(captured[i - 1])] if captured else None
+        following_move = Move(piece, addr(path[i]), captured_piece, following_move)
+    return following_move
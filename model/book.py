@@ -0,0 +1,166 @@
+"""
+Opening book: statistics of moves played in the first plies of stored games.
+
+The book file is a header and fixed size entries (position key, packed move, games, wins, draws, losses),
+sorted by key and, within a key, by games. Wins and losses are counted for the player making the move,
+games without a known result count only in games.
+Keys are Zobrist keys of BitBoard.key() with the side to move. The file is read through mmap
+and searched by bisection, no load step.
+"""
+import mmap
+import struct
+from collections import defaultdict
+
+from model.bitboard import BitBoard, pack, unpack
+from model.items import Player
+
+MAGIC = b'CKOB'
+_HEADER = struct.Struct('<4sIQ')
+_ENTRY = struct.Struct('<QQIIII')
+_PACKED_LIMIT = 1 << 64
+
+# results of model.pdn, from the first player's point of view
+_WINNERS = {'1-0': Player.white, '2-0': Player.white, '0-1': Player.red, '0-2': Player.red}
+_DRAWS = {'1/2-1/2', '1-1'}
+
+
+class BookMove:
+    __slots__ = ('path', 'games', 'wins', 'draws', 'losses')
+
+    def __init__(self, path, games, wins, draws, losses):
+        self.path = path
+        self.games = games
+        self.wins = wins
+        self.draws = draws
+        self.losses = losses
+
+    def __repr__(self):
+        return f"{self.path}: {self.games} games, +{self.wins} -{self.losses} ={self.draws}"
+
+    @property
+    def score(self):
+        """Points of the player making the move per decided game, a draw is half a point."""
+        decided = self.wins + self.draws + self.losses
+        return (self.wins + self.draws / 2) / decided if decided else 0.5
+
+
+def collect(records, plies=12):
+    """
+    Statistics of the first plies of games.
+    :param records: iterable of (headers, moves) from model.pdn, games start from the initial position.
+    :return: {(key, packed move): [games, wins, draws, losses]}
+    """
+    stats = defaultdict(lambda: [0, 0, 0, 0])
+
+    for headers, moves in records:
+        if 'FEN' in headers:
+            continue
+        result = headers.get('Result')
+        winner = _WINNERS.get(result)
+        draw = result in _DRAWS
+
+        position, player = BitBoard.initial(), Player.white
+        for path in moves[:plies]:
+            move = next(m for m in position.generate(player) if m[0] == path)
+            packed = pack(move)
+            if packed < _PACKED_LIMIT:
+                entry = stats[position.key(player), packed]
+                entry[0] += 1
+                entry[1] += winner == player
+                entry[2] += draw
+                entry[3] += winner == player.opponent
+            position, player = position.apply(move, player), player.opponent
+
+    return stats
+
+
+def write(path, stats, plies=12, min_games=1):
+    """Write statistics of collect() to a book file, moves played in fewer than min_games games are dropped."""
+    entries = sorted(((key, packed, *counts) for (key, packed), counts in stats.items() if counts[0] >= min_games),
+                     key=lambda e: (e[0], -e[2], e[1]))
+
+    with open(path, 'wb') as f:
+        f.write(_HEADER.pack(MAGIC, plies, len(entries)))
+        for entry in entries:
+            f.write(_ENTRY.pack(*entry))
+    return len(entries)
+
+
+def build(records, path, plies=12, min_games=1):
+    """:return: number of entries written."""
+    return write(path, collect(records, plies), plies, min_games)
+
+
+class OpeningBook:
+    def __init__(self, path):
+        self.path = path
+        self.file = open(path, 'rb')
+        self.map = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, self.plies, self.size = _HEADER.unpack_from(self.map)
+        if magic != MAGIC:
+            raise ValueError(f"{path} is not an opening book")
+
+    def __len__(self):
+        return self.size
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def close(self):
+        self.map.close()
+        self.file.close()
+
+    def probe(self, position, player):
+        """:return: BookMoves of the position, the most played first, [] when it is not in the book."""
+        return self.probe_key(position.key(player))
+
+    def probe_key(self, key):
+        mm, entry_size = self.map, _ENTRY.size
+        lo, hi = 0, self.size
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if _ENTRY.unpack_from(mm, _HEADER.size + mid * entry_size)[0] < key:
+                lo = mid + 1
+            else:
+                hi = mid
+
+        result = []
+        for i in range(lo, self.size):
+            entry_key, packed, *counts = _ENTRY.unpack_from(mm, _HEADER.size + i * entry_size)
+            if entry_key != key:
+                break
+            result.append(BookMove(unpack(packed), *counts))
+        return result
+
+    def best(self, position, player, min_games=1):
+        """
+        :return: legal (path, captured) move of the most played book move, None when there is none.
+        """
+        for book_move in self.probe(position, player):
+            if book_move.games < min_games:
+                break
+            for move in position.generate(player):
+                if move[0] == book_move.path:
+                    return move
+        return None
+
+    def probe_game(self, game):
+        """:return: [(Move of game.get_possible_moves(), BookMove)] of the position of a Game."""
+        if game.piece_to_continue is not None:
+            return []
+
+        book_moves = {m.path: m for m in self.probe(BitBoard.from_board(game.board), game.current_player)}
+        if not book_moves:
+            return []
+
+        result = []
+        for moves in game.get_possible_moves().values():
+            for move in moves:
+                path = move.path[0]
+                if path in book_moves:
+                    result.append((move, book_moves[path]))
+        return sorted(result, key=lambda m: m[1].games, reverse=True)
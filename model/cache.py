@@ -0,0 +1,50 @@
+"""
+Cache of legal moves of positions, shared by any number of Games.
+"""
+from collections import OrderedDict
+
+from model.bitboard import to_moves
+
+
+class MovesCache:
+    """
+    Least recently used cache of legal moves, keyed by Board.key, which covers the pieces,
+    the side to move and the piece to continue a capture. Moves are stored as (path, captured)
+    tuples, not Moves, so an entry stays valid whichever pieces stand on the squares later.
+    Masks of the position and the board size are stored with the moves and checked on every hit.
+    """
+
+    def __init__(self, size=100000):
+        self.size = size
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __repr__(self):
+        return f"MovesCache({len(self)}/{self.size}, hits: {self.hits}, misses: {self.misses})"
+
+    def get(self, board):
+        """:return: moves of the board, {} when there is none, None when the position is not cached."""
+        entry = self.entries.get(board.key)
+        if entry is None or entry[0] != (board.size, *board.masks):
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        self.entries.move_to_end(board.key)
+        return to_moves(board, entry[1])
+
+    def put(self, board, all_moves):
+        paths = [move.path for moves in all_moves.values() for move in moves]
+        self.entries[board.key] = ((board.size, *board.masks), paths)
+        self.entries.move_to_end(board.key)
+
+        if len(self.entries) > self.size:
+            self.entries.popitem(last=False)
+
+    def clear(self):
+        self.entries.clear()
+        self.hits = self.misses = 0
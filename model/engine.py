@@ -0,0 +1,158 @@
+"""
+Engine opponent of a human player: alpha-beta search under a clock, thinking on the opponent's time.
+
+While the human player is to move, the engine ponders: it predicts the reply, from its transposition
+table or a shallow search, and searches the position after it in a background thread. When the reply
+is the predicted one the pondering is kept: the pondered move is played at once when it searched
+at least as long as the move deserves, otherwise the search goes on with the rest of the time
+and with the table full of the pondered positions. Input of the human player releases the GIL,
+so a thread is enough.
+"""
+import threading
+import time
+
+from model.bitboard import BitBoard, pack, to_move
+from model.search import Searcher, TranspositionTable
+
+MOVES_TO_GO = 30
+STABLE_ITERATIONS = 3
+CAPTURE_EXTENSION = 1.5
+MIN_TIME = 0.01
+MAX_DEPTH = 64
+PREDICTION_DEPTH = 2
+
+
+class TimeManager:
+    """
+    Splits the time on a clock between moves. A move gets an equal share of the remaining time among
+    the moves to go, plus the increment: its soft limit. After an iteration past a half of the soft limit
+    the next one would not finish in time and the search stops, it stops after a quarter of it
+    when the best move did not change in the last STABLE_ITERATIONS iterations.
+    A choice between captures gets CAPTURE_EXTENSION times more, a single legal move is played at once.
+    The hard limit, 3 soft limits but at most a half of the remaining time, ends a search in any case.
+    """
+
+    def __init__(self, total, increment=0.0, moves_to_go=MOVES_TO_GO):
+        """:param total: seconds on the clock."""
+        self.remaining = total
+        self.increment = increment
+        self.moves_to_go = moves_to_go
+
+    def allocate(self, position, player, square=None):
+        """:return: (soft, hard) limits in seconds of the move in position."""
+        share = self.remaining / self.moves_to_go + self.increment
+        moves = position.generate(player, square)
+        if len(moves) > 1 and moves[0][1]:
+            share *= CAPTURE_EXTENSION
+
+        hard = max(min(3 * share, self.remaining / 2), MIN_TIME)
+        return min(share, hard), hard
+
+    def stop_rule(self, soft):
+        """:return: stop function of Searcher.search_position() for a move with the soft limit."""
+        best_moves = []
+
+        def stop(depth, move, score, elapsed):
+            best_moves.append(move[0])
+            recent = best_moves[-STABLE_ITERATIONS:]
+            stable = len(recent) == STABLE_ITERATIONS and recent.count(recent[0]) == len(recent)
+            return elapsed > soft / 2 or stable and elapsed > soft / 4
+        return stop
+
+    def spend(self, elapsed):
+        self.remaining = max(self.remaining - elapsed, 0.0) + self.increment
+
+
+class Engine:
+    def __init__(self, clock, table_bits=20, tablebase=None, book=None, ponder=True):
+        """
+        :param clock: TimeManager of the engine's time.
+        :param ponder: think while the opponent is to move.
+        """
+        self.clock = clock
+        self.searcher = Searcher(TranspositionTable(table_bits), tablebase=tablebase, book=book)
+        self.pondering = ponder
+        self.thread = None
+        self.prediction = None
+        self.ponder_position = None
+        self.ponder_result = None
+        self.ponder_start = None
+        self.hits = 0
+        self.last = None
+
+    def choose(self, game):
+        """:return: Move of game.get_possible_moves() with its following moves, to be made with Game.play()."""
+        position, player = BitBoard.from_board(game.board), game.current_player
+        square = game.piece_to_continue.square if game.piece_to_continue else None
+        pondered, pondered_time = self._stop_pondering((position, player, square))
+
+        start = time.perf_counter()
+        soft, hard = self.clock.allocate(position, player, square)
+        if pondered is not None and pondered_time >= soft:
+            result = pondered
+        else:
+            soft = max(soft - pondered_time, 0.0)
+            result = self.searcher.search_position(position, player, square, MAX_DEPTH, hard,
+                                                   self.clock.stop_rule(soft))
+        self.clock.spend(time.perf_counter() - start)
+
+        self.last = result
+        if result.path is None:
+            # raises EndGameEvent
+            game.get_possible_moves()
+        return to_move(game.board, result.path)
+
+    def ponder(self, game):
+        """Starts thinking on the position after the predicted reply of the player to move in game."""
+        if not self.pondering:
+            return
+        self.stop()
+
+        position, player = BitBoard.from_board(game.board), game.current_player
+        self.prediction = self._predict(position, player)
+        if self.prediction is None:
+            return
+
+        self.ponder_position = position.apply(self.prediction, player), player.opponent, None
+        self.ponder_result = None
+        self.ponder_start = time.perf_counter()
+        self.thread = threading.Thread(target=self._ponder, args=self.ponder_position[:2], daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        """Stops pondering."""
+        self._stop_pondering(None)
+
+    def _predict(self, position, player):
+        moves = position.generate(player)
+        if not moves:
+            return None
+
+        entry = self.searcher.table.probe(position.key(player))
+        if entry is not None:
+            for move in moves:
+                if pack(move) == entry[4]:
+                    return move
+        return self.searcher.search_position(position, player, depth=PREDICTION_DEPTH).path
+
+    def _ponder(self, position, player):
+        self.ponder_result = self.searcher.search_position(position, player, depth=MAX_DEPTH)
+
+    def _stop_pondering(self, position):
+        """
+        :param position: (BitBoard, player, square) to move in.
+        :return: result of pondering and seconds spent on it when it was on position, (None, 0.0) otherwise.
+        """
+        if self.thread is None:
+            return None, 0.0
+
+        # the search may not have started yet when stopped for the first time
+        while self.thread.is_alive():
+            self.searcher.stop()
+            self.thread.join(0.01)
+        self.thread = None
+
+        if position != self.ponder_position or self.ponder_result is None:
+            return None, 0.0
+        self.hits += 1
+        return self.ponder_result, time.perf_counter() - self.ponder_start
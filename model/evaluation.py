@@ -0,0 +1,148 @@
+"""
+Static evaluation of positions: material, kings, advancement of men, men guarding their back rank,
+pieces in the center and mobility (number of quiet moves).
+
+evaluate() scores one BitBoard, evaluate_batch() scores many positions stacked as BatchBoard masks
+in one call with NumPy. Both give the same integer scores, from the point of view of the player to move.
+Weights of the terms are read from a JSON file, model/weights.json by default.
+The terms are masks of the 8x8 board.
+"""
+import json
+import os
+
+import numpy as np
+
+from model.batch import BatchBoard, shift as batch_shift, bits, KING_DISTANCE
+from model.bitboard import DIRECTIONS, MAN_DIRECTIONS, FULL, count, shift
+from model.items import Player
+from model.rays import ROWS, SQUARES, square_index
+
+DEFAULT_PATH = os.path.join(os.path.dirname(__file__), 'weights.json')
+TERMS = ('man', 'king', 'advancement', 'back_rank', 'center', 'mobility')
+
+_ROWS = [sum(1 << square_index(row, col) for col in range(ROWS) if (row + col) % 2) for row in range(ROWS)]
+_BACK_RANK = {Player.white: _ROWS[0], Player.red: _ROWS[-1]}
+_CENTER = sum(1 << square_index(row, col) for row in range(2, 6) for col in range(2, 6) if (row + col) % 2)
+
+
+class Weights:
+    def __init__(self, **weights):
+        unknown = set(weights) - set(TERMS)
+        if unknown:
+            raise ValueError(f"Unknown evaluation terms: {', '.join(sorted(unknown))}")
+        for term in TERMS:
+            setattr(self, term, int(weights.get(term, 0)))
+
+    def __repr__(self):
+        return "Weights({})".format(", ".join(f"{term}={getattr(self, term)}" for term in TERMS))
+
+    @classmethod
+    def load(cls, path=DEFAULT_PATH):
+        with open(path) as f:
+            return cls(**json.load(f))
+
+    def save(self, path):
+        with open(path, 'w') as f:
+            json.dump({term: getattr(self, term) for term in TERMS}, f, indent=2)
+
+
+DEFAULT_WEIGHTS = Weights.load()
+
+
+def mobility(position, player):
+    """Number of quiet moves of player, captures are not counted."""
+    empty = FULL ^ position.occupied
+    men, kings = position.men(player), position.kings(player)
+
+    moves = 0
+    for d in MAN_DIRECTIONS[player]:
+        moves += count(shift(men, d) & empty)
+    for d in DIRECTIONS:
+        slide = kings
+        while slide:
+            slide = shift(slide, d) & empty
+            moves += count(slide)
+    return moves
+
+
+def evaluate(position, player, weights=DEFAULT_WEIGHTS):
+    """Score of a BitBoard position from player's point of view."""
+    white_men, red_men = position.white_men, position.red_men
+    white, red = white_men | position.white_kings, red_men | position.red_kings
+
+    score = weights.man * (count(white_men) - count(red_men)) + \
+        weights.king * (count(position.white_kings) - count(position.red_kings))
+
+    if weights.advancement:
+        for row, mask in enumerate(_ROWS):
+            score += weights.advancement * (row * count(white_men & mask) - (ROWS - 1 - row) * count(red_men & mask))
+    if weights.back_rank:
+        score += weights.back_rank * (count(white_men & _BACK_RANK[Player.white]) -
+                                      count(red_men & _BACK_RANK[Player.red]))
+    if weights.center:
+        score += weights.center * (count(white & _CENTER) - count(red & _CENTER))
+    if weights.mobility:
+        score += weights.mobility * (mobility(position, Player.white) - mobility(position, Player.red))
+
+    return score if player == Player.white else -score
+
+
+def evaluate_move(position, move, player, weights=DEFAULT_WEIGHTS):
+    """
+    Score of a move for 1-ply players, from player's point of view. When the opponent has to capture
+    after it, the position after the worst of those captures is scored: evaluated right after the move,
+    a piece left to be captured and the mobility it had would count as good.
+    """
+    child = position.apply(move, player)
+    replies = child.generate(player.opponent)
+    if replies and replies[0][1]:
+        return min(evaluate(child.apply(reply, player.opponent), player, weights) for reply in replies)
+    return evaluate(child, player, weights)
+
+
+_BITS = np.arange(SQUARES)
+_ROW_OF = _BITS // 4
+_MASKS = {name: bits(np.uint32(mask)) for name, mask in
+          (('white_back', _BACK_RANK[Player.white]), ('red_back', _BACK_RANK[Player.red]), ('center', _CENTER))}
+
+
+def _batch_mobility(men, kings, empty, directions):
+    moves = np.zeros(len(men), dtype=np.int64)
+    for d in directions:
+        moves += bits(batch_shift(men, d) & empty).sum(axis=1)
+    for d in DIRECTIONS:
+        slide = kings
+        for _ in range(KING_DISTANCE):
+            slide = batch_shift(slide, d) & empty
+            moves += bits(slide).sum(axis=1)
+    return moves
+
+
+def evaluate_batch(batch, weights=DEFAULT_WEIGHTS):
+    """
+    Scores of all positions of a BatchBoard, each from the point of view of its player to move.
+    :return: (N,) int64 array.
+    """
+    masks = batch.masks
+    expanded = bits(masks).astype(np.int64)  # (N, 4, 32)
+    white_men, red_men, white_kings, red_kings = (expanded[:, i] for i in range(4))
+    white, red = white_men + white_kings, red_men + red_kings
+
+    score = weights.man * (white_men.sum(axis=1) - red_men.sum(axis=1)) + \
+        weights.king * (white_kings.sum(axis=1) - red_kings.sum(axis=1))
+    score += weights.advancement * (white_men @ _ROW_OF - red_men @ (ROWS - 1 - _ROW_OF))
+    score += weights.back_rank * (white_men @ _MASKS['white_back'] - red_men @ _MASKS['red_back'])
+    score += weights.center * ((white - red) @ _MASKS['center'])
+
+    if weights.mobility:
+        empty = ~(masks[:, 0] | masks[:, 1] | masks[:, 2] | masks[:, 3])
+        score += weights.mobility * (
+            _batch_mobility(masks[:, 0], masks[:, 2], empty, MAN_DIRECTIONS[Player.white]) -
+            _batch_mobility(masks[:, 1], masks[:, 3], empty, MAN_DIRECTIONS[Player.red]))
+
+    return np.where(batch.red_to_move, -score, score)
+
+
+def evaluate_positions(positions, weights=DEFAULT_WEIGHTS):
+    """:param positions: (BitBoard, Player) pairs, :return: list of their scores."""
+    return evaluate_batch(BatchBoard.from_positions(positions), weights).tolist()
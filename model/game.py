@@ -1,61 +1,138 @@
-import itertools as it
-
+from model.bitboard import BitBoard, to_move
 from model.items import Board, Player, Move, EndGameEvent
 from model.generator import MovesGenerator
 
 
 class Game:
-    def __init__(self):
-        self.board = Board()
+    def __init__(self, generator=MovesGenerator, cache=None, tablebase=None, size=8, starting_rows=3):
+        """
+        :param generator: moves generator class, MovesGenerator or model.bitboard.BitboardMovesGenerator.
+        :param cache: model.cache.MovesCache, can be shared by many games.
+        :param tablebase: model.tablebase.Tablebase, the game ends as soon as its result is known from it.
+        :param size: of the board, 10 with 4 starting rows for international draughts.
+            Tablebases support only the 8x8 board.
+        """
+        if tablebase is not None and size != BitBoard.SIZE:
+            raise ValueError(f"Tablebases support only the {BitBoard.SIZE}x{BitBoard.SIZE} board")
+        self.generator = generator
+        self.cache = cache
+        self.tablebase = tablebase
+        self.board = Board(size, starting_rows)
         self.current_player = Player.white
-        self.player_iterator = it.cycle([Player.red, Player.white])
         self.piece_to_continue = None
+        self.history = []
 
     def __enter__(self):
         self.winner = None
+        self.finished = False
         return self
 
     def __exit__(self, exc_type, exc_value, traceback):
         if exc_type is EndGameEvent:
+            # winner is None for a draw
             self.winner = exc_value.args[0]
+            self.finished = True
             return True
 
     def get_possible_moves(self):
-        gen = MovesGenerator(self.current_player, self.board, self.piece_to_continue)
+        if self.cache is None:
+            return self._generate()
+
+        all_moves = self.cache.get(self.board)
+        if all_moves is None:
+            try:
+                all_moves = self._generate()
+            except EndGameEvent:
+                # results known from the tablebase are not lost positions
+                if self.tablebase is None:
+                    self.cache.put(self.board, {})
+                raise
+            self.cache.put(self.board, all_moves)
+
+        if not all_moves:
+            raise EndGameEvent(self.current_player.opponent)
+        return all_moves
+
+    def _generate(self):
+        gen = self.generator(self.current_player, self.board, self.piece_to_continue, tablebase=self.tablebase)
         return gen.generate()
 
     def move(self, move: Move):
-        piece = move.piece
-
-        self.board.move(piece, move.dest)
-        if move.is_capturing:
-            self.board.pick_up(move.captured_piece)
+        origin = move.piece.addr
+        square_index = self.board.geometry.square_index
+        self.history.append((self.current_player, self.piece_to_continue, square_index(*origin),
+                             square_index(*move.dest)))
+        self.board.apply(move)
 
-        if self._can_be_upgraded(piece):
-            self.board.put(piece.upgrade())
+        if self.piece_to_continue is not None:
+            self.board.toggle_continuation(origin)
 
         if move.following_move:
-            self.piece_to_continue = piece
+            self.piece_to_continue = move.piece
+            self.board.toggle_continuation(move.piece.addr)
         else:
             self.piece_to_continue = None
             self._change_player()
 
+    def play(self, move: Move):
+        """Make move together with all its following moves."""
+        while move is not None:
+            self.move(move)
+            move = move.following_move
+
+    def undo(self):
+        """Revert the last move() call."""
+        self.board.undo()
+        self.current_player, self.piece_to_continue = self.history.pop()[:2]
+
+    def moves(self):
+        """Paths of the moves made so far, squares visited by the moved piece, see model.bitboard."""
+        paths = []
+        for _, piece_to_continue, origin, dest in self.history:
+            if piece_to_continue is None:
+                paths.append((origin, dest))
+            else:
+                paths[-1] += (dest,)
+        return paths
+
+    def has_legal_move(self):
+        """True when the player to move can move, without generating all the moves."""
+        position, square = self._position()
+        return position.has_move(self.current_player, square)
+
+    def is_capture_forced(self):
+        position, square = self._position()
+        return position.has_capture(self.current_player, square)
+
+    def is_legal(self, src, path):
+        """
+        :param src: address of the moved piece.
+        :param path: addresses the piece visits, all steps of a capture.
+        """
+        square_index = self.board.geometry.square_index
+        squares = (square_index(*src),) + tuple(square_index(*addr) for addr in path)
+        position, square = self._position()
+        return position.is_legal(self.current_player, squares, square)
+
+    def iter_moves(self):
+        """Moves of get_possible_moves(), one by one. Quiet moves are generated only when they are asked for."""
+        position, square = self._position()
+        for move in position.iter_moves(self.current_player, square):
+            yield to_move(self.board, move)
+
+    def _position(self):
+        square = self.piece_to_continue.square if self.piece_to_continue else None
+        return BitBoard.from_board(self.board), square
+
     def get_board(self):
         return self.board()
 
     def continues(self):
-        return self.winner is None
+        return not self.finished
 
     def _change_player(self):
-        self.current_player = next(self.player_iterator)
-
-    def _can_be_upgraded(self, piece):
-        last_row = 0 if piece.player == Player.red else 7
-
-        has_reached_last_row = piece.row == last_row
-        is_piece = hasattr(piece, 'upgrade')
-
-        return has_reached_last_row and is_piece
+        self.current_player = self.current_player.opponent
+        self.board.toggle_side()
 
 
 if __name__ == '__main__':
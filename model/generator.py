@@ -1,21 +1,31 @@
-from model.items import EmptyField, Piece, King, Move, EndGameEvent
+from model.items import EmptyField, King, Move, EndGameEvent
+from model.rays import DIRECTIONS
+from model.tablebase import adjudicate
 from collections import OrderedDict
-import itertools as it
 
 
 class MovesGenerator:
-    def __init__(self, player, board, piece=None):
+    def __init__(self, player, board, piece=None, tablebase=None):
+        """
+        :param tablebase: model.tablebase.Tablebase, positions found there end the game with their known result.
+        """
         self.player = player
         self.board = board
         self.max_length = 0
         self.pieces = []
         self.specific_piece = piece
+        self.tablebase = tablebase
 
     def generate(self):
         if self.specific_piece:
             self.pieces = [self.specific_piece]
         else:
-            self.pieces = self._get_pieces()
+            self.pieces = self.board.get_pieces(self.player)
+
+        if not self.pieces:
+            raise EndGameEvent(self.player.opponent)
+        if self.tablebase is not None and self.specific_piece is None:
+            adjudicate(self.tablebase, self.board, self.player)
 
         captures = self._get_captures()
         if self._any_available(captures):
@@ -27,27 +37,14 @@ class MovesGenerator:
 
         raise EndGameEvent(self.player.opponent)
 
-    def _get_pieces(self):
-        pieces = []
-        for row in self.board():
-            for item in row:
-                if isinstance(item, Piece) and item.player == self.player:
-                    pieces.append(item)
-        return pieces
-
     def _get_captures(self):
-        all_captures = OrderedDict()
+        longest = _LongestCaptures()
 
         for piece in self.pieces:
-            generator = _CapturesFinder(piece, self.board)
-            captures = generator.generate()
-
-            if captures:
-                all_captures[piece] = captures
+            generator = _CapturesFinder(piece, self.board, longest)
+            generator.generate()
 
-        all_captures = self._remove_all_but_longest(all_captures)
-
-        return all_captures
+        return longest.get_moves()
 
     def _get_moves(self):
         all_moves = OrderedDict()
@@ -67,20 +64,6 @@ class MovesGenerator:
                 return True
         return False
 
-    def _remove_all_but_longest(self, captures_dict):
-        if not captures_dict:
-            return captures_dict
-
-        max_len = max([len(i) for i in list(it.chain.from_iterable(captures_dict.values()))])
-
-        longest = {}
-        for piece, captures_list in captures_dict.items():
-            captures = [c for c in captures_list if len(c) == max_len]
-            if captures:
-                longest[piece] = captures
-
-        return longest
-
 
 class _Finder:
     def __init__(self, piece, board):
@@ -90,109 +73,97 @@ class _Finder:
     def generate(self):
         raise NotImplementedError()
 
-    @staticmethod
-    def _get_fields_between(addr1, addr2):
-        fields = []
-        r1, c1 = addr1
-        r2, c2 = addr2
-
-        assert abs(r2-r1) == abs(c2-c1), f"{addr1} -> {addr2}, impossible move."
+    def _get_rays(self, directions, length):
+        rays = self.piece.geometry.addr_rays[self.piece.addr]
+        return [rays[d][:length] for d in DIRECTIONS[directions]]
 
-        length = abs(r2-r1)
-        direction = (int((r2-r1)/length), int((c2-c1)/length))
 
-        for i in range(1, length):
-            field = _vector_sum(addr1, *(direction, )*i)
-            fields.append(field)
-        return fields
+class _LongestCaptures:
+    """
+    Capture sequences of the greatest length found so far, as lists of (destination, captured piece) steps.
+    Shorter sequences are dropped as soon as they end, Moves are built only for the remaining ones.
+    """
 
+    def __init__(self):
+        self.length = 0
+        self.sequences = []
 
-class _CapturesFinder(_Finder):
-    def generate(self):
-        reachable = self.piece.get_my_diagonal_neighbours(max_dist=self.piece.max_distance+1,
-                                                          min_dist=2, direction='nwse')
-        result = []
-
-        for destination in reachable:
-            target = self._get_piece_to_capture(destination)
-            if target is None: continue
-
-            this_capture = Move(self.piece, destination, captured_piece=target)
-            following_captures = self._find_following_captures(this_capture)
-
-            if following_captures:
-                for following_capture in following_captures:
-                    capture = this_capture.clone()
-                    capture.following_move = following_capture
-                    result.append(capture)
-            else:
-                result.append(this_capture)
+    def add(self, piece, steps):
+        if len(steps) > self.length:
+            self.length = len(steps)
+            self.sequences = []
 
-        return result
+        if len(steps) == self.length:
+            self.sequences.append((piece, tuple(steps)))
 
-    def _get_piece_to_capture(self, destination):
-        possible_victims = []
-        addrs_between = self._get_fields_between(self.piece.addr, destination)
-        for addr in addrs_between:
-            field = self.board()[addr]
-
-            is_occupied = isinstance(field, Piece) or isinstance(field, King)
-            is_occupied_by_other_player = hasattr(field, "player") and field.player != self.piece.player
+    def get_moves(self):
+        all_captures = OrderedDict()
 
-            if is_occupied and not is_occupied_by_other_player:
-                return None
-            elif is_occupied and is_occupied_by_other_player:
-                possible_victims.append(field)
+        for piece, steps in self.sequences:
+            move = None
+            for destination, captured_piece in reversed(steps):
+                move = Move(piece, destination, captured_piece, move)
+            all_captures.setdefault(piece, []).append(move)
 
-        is_destination_empty = isinstance(self.board()[destination], EmptyField)
-        if len(possible_victims) == 1 and is_destination_empty:
-            return possible_victims[0]
-        else:
-            return None
+        return all_captures
 
-    def _find_following_captures(self, previous):
-        board = self.board.clone()
-        board.move(previous.piece.clone(), previous.dest)
-        board.pick_up(previous.captured_piece)
-        piece = board()[previous.dest]
 
-        generator = _CapturesFinder(piece, board)
-        captures = generator.generate()
+class _CapturesFinder(_Finder):
+    def __init__(self, piece, board, longest):
+        super().__init__(piece, board)
+        self.longest = longest
+        self.steps = []
 
-        return captures
+    def generate(self):
+        """Depth first search of capture sequences, the captures are made and reverted on the board."""
+        is_extended = False
+
+        for ray in self._get_rays('nwse', self.piece.max_distance + 1):
+            for destination, target in self._get_landings(ray):
+                is_extended = True
+
+                self.steps.append((destination, target))
+                # a man passing the last row during the capture is not crowned
+                self.board.make(self.piece, destination, target)
+                try:
+                    self.generate()
+                finally:
+                    self.board.undo()
+                    self.steps.pop()
+
+        if not is_extended and self.steps:
+            self.longest.add(self.piece, self.steps)
+
+    def _get_landings(self, ray):
+        """
+        Walk the ray, the only opponent's piece met on the way can be captured
+        by landing on any of the empty fields right behind it.
+        """
+        board = self.board()
+        victim = None
+
+        for addr in ray:
+            field = board[addr]
+
+            if isinstance(field, EmptyField):
+                if victim is not None:
+                    yield addr, victim
+            elif victim is None and field.player != self.piece.player:
+                victim = field
+            else:
+                return
 
 
 class _MovesFinder(_Finder):
     def generate(self):
         moves = []
         dir_to_move = 'nwse' if isinstance(self.piece, King) else self.piece.player.value
+        board = self.board()
 
-        addrs = self.piece.get_my_diagonal_neighbours(max_dist=self.piece.max_distance, direction=dir_to_move)
-
-        for addr in addrs:
-            if self._has_clear_path(destination=addr):
-                move = Move(self.piece, addr)
-                moves.append(move)
+        for ray in self._get_rays(dir_to_move, self.piece.max_distance):
+            for addr in ray:
+                if not isinstance(board[addr], EmptyField):
+                    break
+                moves.append(Move(self.piece, addr))
 
         return moves
-
-    def _has_clear_path(self, destination):
-        addrs_between = self._get_fields_between(self.piece.addr, destination)
-
-        for addr in [*addrs_between, destination]:
-            field = self.board()[addr]
-            is_occupied = isinstance(field, Piece) or isinstance(field, King)
-            if is_occupied:
-                return False
-        return True
-
-
-def _vector_sum(basic_addr, *addrs, reverse_addrs=False):
-    temp = []
-    if reverse_addrs:
-        for addr in addrs:
-            temp.append([-1 * i for i in addr])
-    else:
-        temp = addrs
-
-    return tuple([sum(addr) for addr in zip(basic_addr, *temp)])
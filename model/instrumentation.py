@@ -0,0 +1,189 @@
+"""
+Optional instrumentation of the hot paths of the model.
+
+Measurements are scoped by a context manager:
+
+    with measure() as metrics:
+        play a game or run a search
+    print(metrics.to_prometheus())
+
+A measurement records only the calls of the thread or asyncio task it is active in, the active
+measurements are kept in a context variable. The measured methods are replaced by timing wrappers once,
+by the first measurement, the originals are kept so that wrappers are never stacked. Until then there
+is no cost, afterwards calls outside of measurements only check the context variable.
+Nested measurements all record the same calls.
+
+Measured are MovesGenerator.generate, _CapturesFinder.generate (one capture search from its root,
+with the number of nodes and the depth of the capture tree), Board.clone and Game.move.
+"""
+import contextlib
+import contextvars
+import functools
+import json
+import random
+import threading
+import time
+
+from model import generator
+from model.game import Game
+from model.items import Board
+
+PERCENTILES = (50, 90, 99)
+MAX_SAMPLES = 10000
+PREFIX = 'checkers'
+
+
+class Metric:
+    """Count, sum and a uniform sample of recorded values, percentiles are estimated from the sample."""
+
+    def __init__(self, name, unit=''):
+        self.name = name
+        self.unit = unit
+        self.count = 0
+        self.total = 0.0
+        self.maximum = 0.0
+        self.samples = []
+        self.random = random.Random(0)
+
+    def record(self, value):
+        self.count += 1
+        self.total += value
+        self.maximum = max(self.maximum, value)
+
+        if len(self.samples) < MAX_SAMPLES:
+            self.samples.append(value)
+        else:
+            i = self.random.randrange(self.count)
+            if i < MAX_SAMPLES:
+                self.samples[i] = value
+
+    def percentile(self, p):
+        if not self.samples:
+            return 0.0
+        ordered = sorted(self.samples)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * p / 100))]
+
+    def snapshot(self):
+        result = {'count': self.count, 'sum': self.total, 'max': self.maximum,
+                  'mean': self.total / self.count if self.count else 0.0}
+        for p in PERCENTILES:
+            result[f'p{p}'] = self.percentile(p)
+        return result
+
+
+class Metrics:
+    def __init__(self):
+        self.metrics = {}
+
+    def __getitem__(self, name):
+        return self.metrics[name]
+
+    def __contains__(self, name):
+        return name in self.metrics
+
+    def record(self, name, value, unit='seconds'):
+        metric = self.metrics.get(name)
+        if metric is None:
+            metric = self.metrics[name] = Metric(name, unit)
+        metric.record(value)
+
+    def snapshot(self):
+        return {name: dict(metric.snapshot(), unit=metric.unit) for name, metric in sorted(self.metrics.items())}
+
+    def to_json(self):
+        return json.dumps(self.snapshot(), indent=2)
+
+    def to_prometheus(self):
+        """Summaries in the Prometheus text exposition format."""
+        lines = []
+        for name, metric in sorted(self.metrics.items()):
+            full_name = f"{PREFIX}_{name.replace('.', '_')}" + (f"_{metric.unit}" if metric.unit else "")
+            lines.append(f"# TYPE {full_name} summary")
+            for p in PERCENTILES:
+                lines.append(f'{full_name}{{quantile="{p / 100}"}} {metric.percentile(p)}')
+            lines.append(f"{full_name}_sum {metric.total}")
+            lines.append(f"{full_name}_count {metric.count}")
+        return "\n".join(lines) + "\n"
+
+
+# metrics of the measurements active in the current thread or asyncio task
+_active = contextvars.ContextVar('metrics', default=())
+# capture tree of the capture search in progress
+_tree = contextvars.ContextVar('capture_tree')
+_originals = {}
+_lock = threading.Lock()
+
+
+def _record(name, value, unit='seconds'):
+    for metrics in _active.get():
+        metrics.record(name, value, unit)
+
+
+def _timed(name, function):
+    @functools.wraps(function)
+    def wrapper(*args, **kwargs):
+        if not _active.get():
+            return function(*args, **kwargs)
+        start = time.perf_counter()
+        try:
+            return function(*args, **kwargs)
+        finally:
+            _record(name, time.perf_counter() - start)
+    return wrapper
+
+
+def _capture_search(function):
+    # generate() calls itself for every node of the capture tree, only the root call is timed
+    @functools.wraps(function)
+    def wrapper(finder):
+        if not _active.get():
+            return function(finder)
+
+        depth = len(finder.steps)
+        if depth:
+            tree = _tree.get()
+            tree['nodes'] += 1
+            tree['depth'] = max(tree['depth'], depth)
+            return function(finder)
+
+        tree = {'nodes': 1, 'depth': 0}
+        token = _tree.set(tree)
+        start = time.perf_counter()
+        try:
+            return function(finder)
+        finally:
+            _tree.reset(token)
+            _record('captures_finder.generate', time.perf_counter() - start)
+            _record('capture_tree.nodes', tree['nodes'], '')
+            _record('capture_tree.depth', tree['depth'], '')
+    return wrapper
+
+
+_TARGETS = (
+    (generator.MovesGenerator, 'generate', lambda f: _timed('moves_generator.generate', f)),
+    (generator._CapturesFinder, 'generate', _capture_search),
+    (Board, 'clone', lambda f: _timed('board.clone', f)),
+    (Game, 'move', lambda f: _timed('game.move', f)),
+)
+
+
+def _install():
+    with _lock:
+        if _originals:
+            return
+        for owner, attribute, wrap in _TARGETS:
+            original = owner.__dict__[attribute]
+            _originals[owner, attribute] = original
+            setattr(owner, attribute, wrap(original))
+
+
+@contextlib.contextmanager
+def measure():
+    """Records into a new Metrics calls made in the current thread or asyncio task while the context is active."""
+    _install()
+    metrics = Metrics()
+    token = _active.set(_active.get() + (metrics,))
+    try:
+        yield metrics
+    finally:
+        _active.reset(token)
@@ -5,6 +5,9 @@ from enum import Enum
 
 import numpy as np
 
+from model import zobrist
+from model.rays import DIRECTIONS, STANDARD, geometry
+
 
 class Player(Enum):
     white = 's'
@@ -12,17 +15,21 @@ class Player(Enum):
 
     @property
     def opponent(self):
-        if self.name == Player.white:
+        if self == Player.white:
             return Player.red
         else:
             return Player.white
 
 
 class BoardMember:
-    def __init__(self, row: int, col: int, available: bool):
+    __slots__ = ('row', 'col', 'available', 'geometry')
+
+    def __init__(self, row: int, col: int, available: bool, geometry=STANDARD):
+        """:param geometry: model.rays.Geometry of the board."""
         self.row = row
         self.col = col
         self.available = available
+        self.geometry = geometry
 
     @property
     def addr(self):
@@ -32,7 +39,12 @@ class BoardMember:
     def addr(self, new_addr):
         self.row, self.col = new_addr
 
-    def get_my_diagonal_neighbours(self, max_dist=7, min_dist=1, direction='nwse'):
+    @property
+    def square(self):
+        """Index of the playable square, 0..31 on the 8x8 board, see model.rays."""
+        return self.geometry.square_index(self.row, self.col)
+
+    def get_my_diagonal_neighbours(self, max_dist=None, min_dist=1, direction='nwse'):
         """
         example: get all +'s for field 'adr'
 
@@ -46,91 +58,209 @@ class BoardMember:
         -  +  -  -  -  -  -  -
         """
 
-        # order here matters
-        nw, ne, se, sw = [(-1, -1)], [(-1, 1)], [(1, 1)], [(1, -1)]
-        n, s = nw + ne, sw + se
-        nwse = nw + ne + se + sw
-        dirs = dict(zip(['nwse', 'n', 's', 'nw', 'ne', 'sw', 'se'],
-                        [nwse, n, s, nw, ne, se, sw]))
-
-        result = []
-        for dr, dist in it.product(dirs[direction], range(min_dist, max_dist + 1)):
-            r = self.row + dr[0] * dist
-            c = self.col + dr[1] * dist
-            if _is_on_board(r, c):
-                result.append((r, c))
-        return result
+        rays = self.geometry.addr_rays[self.addr]
+        return [addr for d in DIRECTIONS[direction] for addr in rays[d][min_dist - 1:max_dist]]
 
 
 class EmptyField(BoardMember):
+    """
+    Field without a piece. Empty fields never change, there is one per field of every board size,
+    shared by all boards, see empty_field(). Boards, moves and copies only pass references to them.
+    """
+    __slots__ = ()
+
+    def __init__(self, row, col, available, geometry=STANDARD):
+        for name, value in zip(BoardMember.__slots__, (row, col, available, geometry)):
+            object.__setattr__(self, name, value)
+
+    def __setattr__(self, name, value):
+        raise AttributeError(f"EmptyField is immutable, cannot set {name}")
+
     def __repr__(self):
         return "  "
 
+    def __copy__(self):
+        return self
+
+    def __deepcopy__(self, memo):
+        return self
+
+    def __reduce__(self):
+        return empty_field, (self.row, self.col, self.geometry.rows)
+
+
+_empty_fields = {}
+
+
+def empty_fields(size=8):
+    """Array of the shared empty fields of the board size, not to be changed."""
+    fields = _empty_fields.get(size)
+    if fields is None:
+        board_geometry = geometry(size)
+        fields = np.empty((size, size), dtype=BoardMember)
+        for row, col in it.product(range(size), range(size)):
+            fields[row, col] = EmptyField(row, col, not (row + col + 1) % 2, board_geometry)
+        fields.flags.writeable = False
+        _empty_fields[size] = fields
+    return fields
+
+
+def empty_field(row, col, size=8):
+    return empty_fields(size)[row, col]
+
+
+# ids are given by the square a piece is created on, counted from the player's own side
+_IDS = st.ascii_lowercase + st.digits
+
 
 class Piece(BoardMember):
-    items_created = dict([(i, 0) for i in Player])
+    __slots__ = ('player', 'id')
+    max_distance = 1
 
-    def __init__(self, row, col, player, id=None):
-        super().__init__(row, col, True)
+    def __init__(self, row, col, player, id=None, geometry=STANDARD):
+        super().__init__(row, col, True, geometry)
         self.player = player
-        self.max_distance = 1
-        self.id = id if id else st.ascii_lowercase[Piece.items_created[player]]
-        Piece.items_created[player] += 1
+        self.id = id if id else self._default_id(row, col, player, geometry)
 
     def __repr__(self):
         return f"{self.player.name[0]}P"
 
-    def __del__(self):
-        Piece.items_created[self.player] -= 1
+    @staticmethod
+    def _default_id(row, col, player, geometry):
+        square = geometry.square_index(row, col)
+        # squares far from the own side of big boards share ids, starting pieces never do
+        return _IDS[(square if player == Player.white else geometry.squares - 1 - square) % len(_IDS)]
+
+    @property
+    def kind(self):
+        return zobrist.RED_MAN if self.player == Player.red else zobrist.WHITE_MAN
+
+    @property
+    def key(self):
+        return zobrist.keys(self.geometry.squares).pieces[self.kind][self.square]
 
     def upgrade(self):
-        return King(self.row, self.col, self.player, id=self.id)
+        return King(self.row, self.col, self.player, id=self.id, geometry=self.geometry)
 
     def clone(self):
-        return copy.deepcopy(self)
+        # all attributes are immutable or shared
+        return copy.copy(self)
 
 
 class King(Piece):
-    def __init__(self, row, col, player, id=None):
-        super().__init__(row, col, player, id)
-        self.max_distance = 7
-        Piece.items_created[player] -= 1
+    __slots__ = ()
 
     def __repr__(self):
         return f"{self.player.name[0]}K"
 
+    @property
+    def max_distance(self):
+        return self.geometry.rows - 1
+
+    @property
+    def kind(self):
+        return zobrist.RED_KING if self.player == Player.red else zobrist.WHITE_KING
+
 
 class Board:
-    def __init__(self):
-        self.board = np.empty((8, 8), dtype=BoardMember)
+    def __init__(self, size=8, starting_rows=3):
+        """
+        :param size: rows and columns of the board, 10 for international draughts.
+        :param starting_rows: rows filled by pieces of each player at the start, 4 for international draughts.
+        """
+        self._init_geometry(size)
         self._init_fields()
         for player in Player:
-            self._init_pieces(player)
+            self._init_pieces(player, starting_rows)
+        self._init_state()
+
+    @classmethod
+    def from_masks(cls, masks, size=8):
+        """Board with pieces given by white men, red men, white kings and red kings masks, see model.bitboard."""
+        board = cls.__new__(cls)
+        board._init_geometry(size)
+        board._init_fields()
+
+        for kind, mask in enumerate(masks):
+            player = Player.red if kind in (zobrist.RED_MAN, zobrist.RED_KING) else Player.white
+            for square in range(board.geometry.squares):
+                if mask >> square & 1:
+                    row, col = board.geometry.square_addr(square)
+                    piece = Piece(row, col, player, geometry=board.geometry)
+                    board.board[row, col] = piece.upgrade() if kind >= zobrist.WHITE_KING else piece
+
+        board._init_state()
+        return board
+
+    @property
+    def size(self):
+        return self.geometry.rows
 
     def __repr__(self):
-        view = "  0  1  2  3  4  5  6  7\n"
+        view = " " + "".join(f"{col:>3}" for col in range(self.size)) + "\n"
         i = 0
         for row in self.board:
             view = view + str(i) + ",".join([item.__repr__() for item in row]) + "\n"
             i += 1
         return view
 
+    def _init_geometry(self, size):
+        self.geometry = geometry(size)
+        self.keys = zobrist.keys(self.geometry.squares)
+        self.empty = empty_fields(size)
+
     def _init_fields(self):
-        for row, col in it.product(range(8), range(8)):
-            available = not (row + col + 1) % 2
-            self.board[row, col] = EmptyField(row, col, available)
+        self.board = self.empty.copy()
+
+    def _init_pieces(self, player, starting_rows=3):
+        if not 0 < starting_rows < self.size // 2:
+            raise ValueError(f"{starting_rows} starting rows do not fit on the {self.size}x{self.size} board")
 
-    def _init_pieces(self, player):
-        starting_rows = self.board[:3] if player == Player.white else self.board[-3:]
-        for (addr, field) in np.ndenumerate(starting_rows):
+        rows = self.board[:starting_rows] if player == Player.white else self.board[-starting_rows:]
+        for (addr, field) in np.ndenumerate(rows):
             if field.available:
-                starting_rows[addr] = Piece(field.row, field.col, player)
+                rows[addr] = Piece(field.row, field.col, player, geometry=self.geometry)
+
+    def _init_state(self):
+        """Undo history, pieces of players, masks and key of pieces placed directly in self.board."""
+        self.history = []
+        self.pieces = dict([(player, {}) for player in Player])
+        self.masks = [0] * 4
+        self.key = 0
+
+        for row in self.board:
+            for item in row:
+                if isinstance(item, Piece):
+                    self._add(item)
 
     def __call__(self):
         return self.board
 
+    def get_pieces(self, player):
+        """Pieces of player in order of their squares."""
+        pieces = self.pieces[player]
+        return [pieces[square] for square in sorted(pieces)]
+
+    def count(self, player):
+        return len(self.pieces[player])
+
+    def _add(self, piece):
+        square = piece.square
+        self.pieces[piece.player][square] = piece
+        self.masks[piece.kind] ^= 1 << square
+        self.key ^= self.keys.pieces[piece.kind][square]
+
+    def _remove(self, piece):
+        square = piece.square
+        del self.pieces[piece.player][square]
+        self.masks[piece.kind] ^= 1 << square
+        self.key ^= self.keys.pieces[piece.kind][square]
+
     def pick_up(self, item: BoardMember):
-        self.board[item.addr] = EmptyField(*item.addr, available=True)
+        addr = item.addr
+        self.board[addr] = self.empty[addr]
+        if isinstance(item, Piece):
+            self._remove(item)
         return item
 
     def move(self, item: BoardMember, dest):
@@ -142,22 +272,131 @@ class Board:
         if not addr:
             addr = item.addr
 
+        replaced = self.board[addr]
+        if isinstance(replaced, Piece):
+            self._remove(replaced)
+
         self.board[addr] = item
 
         item.addr = addr
+        if isinstance(item, Piece):
+            self._add(item)
+
+    def toggle_side(self):
+        self.key ^= self.keys.side
+
+    def toggle_continuation(self, addr):
+        self.key ^= self.keys.continuation[self.geometry.square_index(*addr)]
+
+    def compute_key(self, player, piece_to_continue=None):
+        """Zobrist key computed from scratch, self.key is kept equal to it incrementally by Board and Game."""
+        masks = [0] * 4
+        for row in self.board:
+            for item in row:
+                if isinstance(item, Piece):
+                    masks[item.kind] |= 1 << item.square
+
+        continuation = piece_to_continue.square if piece_to_continue else None
+        return self.keys.masks_key(masks, player == Player.red, continuation)
+
+    def apply(self, move, crown=True):
+        """
+        Make a single step of the move in place. Can be reverted with undo().
+        :param move: Move, its following moves are not applied.
+        :param crown: upgrade a man finishing its move on the last row.
+        """
+        self.make(move.piece, move.dest, move.captured_piece, crown and move.following_move is None)
+
+    def make(self, piece, dest, captured_piece=None, crown=False):
+        """The same as apply() for a step given by its parts, without creating a Move."""
+        origin = piece.addr
+        key = self.key
+
+        self.move(piece, dest)
+        if captured_piece is not None:
+            self.pick_up(captured_piece)
+
+        king = None
+        if crown and self._can_be_upgraded(piece):
+            king = piece.upgrade()
+            self.put(king)
+
+        self.history.append((piece, origin, captured_piece, king, key))
+
+    def undo(self):
+        """Revert the last step made with apply(), together with side and continuation toggled after it."""
+        piece, origin, captured_piece, king, key = self.history.pop()
+
+        if king is not None:
+            self.put(piece, king.addr)
+
+        self.move(piece, origin)
+        if captured_piece is not None:
+            self.put(captured_piece)
+
+        self.key = key
+
+    def _can_be_upgraded(self, piece):
+        last_row = 0 if piece.player == Player.red else self.size - 1
+
+        has_reached_last_row = piece.row == last_row
+        is_piece = not isinstance(piece, King)
+
+        return has_reached_last_row and is_piece
 
     def clone(self):
-        return copy.deepcopy(self)
+        """Copy with copies of the pieces and of the undo history, empty fields are shared."""
+        copies = {}
+
+        def copied(piece):
+            if piece is None:
+                return None
+            result = copies.get(id(piece))
+            if result is None:
+                result = copies[id(piece)] = piece.clone()
+            return result
+
+        board = copy.copy(self)
+        board.board = self.board.copy()
+        board.pieces = {player: {square: copied(piece) for square, piece in pieces.items()}
+                        for player, pieces in self.pieces.items()}
+        for pieces in board.pieces.values():
+            for piece in pieces.values():
+                board.board[piece.addr] = piece
+        board.masks = list(self.masks)
+        board.history = [(copied(piece), origin, copied(captured_piece), copied(king), key)
+                         for piece, origin, captured_piece, king, key in self.history]
+        return board
 
 
 class Move:
+    __slots__ = ('piece', 'dest', 'captured_piece', 'following_move')
+
     def __init__(self, piece: BoardMember, dest: BoardMember, captured_piece: BoardMember = None, following_move=None):
         self.piece = piece
         self.dest = dest
         self.captured_piece = captured_piece
-        self.is_capturing = captured_piece is not None
         self.following_move = following_move
 
+    @property
+    def is_capturing(self):
+        return self.captured_piece is not None
+
+    @property
+    def path(self):
+        """
+        Compact form of the move with all its following moves, the same as moves of model.bitboard:
+        (squares visited by the piece, squares of captured pieces).
+        """
+        path, captured = [self.piece.square], []
+        move = self
+        while move is not None:
+            path.append(self.piece.geometry.square_index(*move.dest))
+            if move.captured_piece is not None:
+                captured.append(move.captured_piece.square)
+            move = move.following_move
+        return tuple(path), tuple(captured)
+
     def __repr__(self):
         return f"{self.piece}: {self.piece.addr} -> {self.dest}"
 
@@ -165,7 +404,7 @@ class Move:
         n = 1
         move = self
         while move.following_move is not None:
-            move = self.following_move
+            move = move.following_move
             n += 1
         return n
 
@@ -182,7 +421,3 @@ class Move:
 
 class EndGameEvent(Exception):
     pass
-
-
-def _is_on_board(r, c):
-    return 0 <= r <= 7 and 0 <= c <= 7
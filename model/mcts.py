@@ -0,0 +1,221 @@
+"""
+Monte Carlo tree search over BitBoard positions.
+
+UCT selection, one expanded node per playout, rollouts by a policy choosing moves of a BitBoard
+position, or batches of random rollouts played together with model.batch (leaf parallelism).
+A rollout too long for its limit is a draw. Scores of nodes are from the point of view of the player
+who made the move leading to them: a win is 1, a draw 0.5.
+
+The tree of the chosen move is kept and reused for the next search when the game continues from it.
+Root parallelism runs independent searches in worker processes and adds up their visit counts.
+Like the alpha-beta search, it plays on the 8x8 board only.
+"""
+import math
+import random
+import time
+
+import numpy as np
+
+from model.batch import BatchBoard, play_out
+from model.bitboard import BitBoard, pack
+from model.items import Player
+from model.evaluation import evaluate_move
+
+EXPLORATION = 1.4
+ROLLOUT_PLIES = 150
+
+
+def random_policy(position, player, moves, rnd):
+    return rnd.choice(moves)
+
+
+def greedy_policy(position, player, moves, rnd):
+    """Move with the best static evaluation after it, see evaluate_move(), ties are broken randomly."""
+    scored = [(evaluate_move(position, move, player), rnd.random(), move) for move in moves]
+    return max(scored)[2]
+
+
+POLICIES = {'random': random_policy, 'greedy': greedy_policy}
+
+
+class Node:
+    __slots__ = ('position', 'player', 'move', 'parent', 'children', 'untried', 'visits', 'score')
+
+    def __init__(self, position, player, move=None, parent=None):
+        """
+        :param player: Player to move in position.
+        :param move: (path, captured) move leading to this node from its parent.
+        """
+        self.position = position
+        self.player = player
+        self.move = move
+        self.parent = parent
+        self.children = []
+        self.untried = position.generate(player)
+        self.visits = 0
+        self.score = 0.0
+
+    def select(self, exploration):
+        log_visits = math.log(self.visits)
+        return max(self.children, key=lambda c: c.score / c.visits + exploration * math.sqrt(log_visits / c.visits))
+
+    def find(self, position, player):
+        """Node of position among this node and its children, None when it is not there."""
+        if self.player == player and self.position == position:
+            return self
+        for child in self.children:
+            if child.player == player and child.position == position:
+                return child
+        return None
+
+
+class MCTSResult:
+    def __init__(self, move, visits, value, playouts, elapsed):
+        """
+        :param move: (path, captured) of the most visited move.
+        :param visits: {packed move: visits} of the root moves.
+        :param value: average score of the chosen move, 0..1 for the player to move.
+        """
+        self.move = move
+        self.visits = visits
+        self.value = value
+        self.playouts = playouts
+        self.elapsed = elapsed
+
+    def __repr__(self):
+        return f"{self.move} value: {self.value:.3f}, playouts: {self.playouts}, " \
+               f"{self.playouts_per_second:.0f} playouts/s"
+
+    @property
+    def playouts_per_second(self):
+        return self.playouts / self.elapsed if self.elapsed else 0.0
+
+
+class MCTS:
+    def __init__(self, exploration=EXPLORATION, policy=random_policy, batch_size=1, rollout_plies=ROLLOUT_PLIES,
+                 seed=None):
+        """
+        :param policy: function (position, player, moves, random.Random) -> move of rollouts.
+        :param batch_size: rollouts played together from every new leaf with model.batch, random moves only.
+        """
+        self.exploration = exploration
+        self.policy = policy
+        self.batch_size = batch_size
+        self.rollout_plies = rollout_plies
+        self.random = random.Random(seed)
+        self.random_state = np.random.RandomState(self.random.getrandbits(32))
+        self.root = None
+
+    def search(self, position, player, playouts=None, time_limit=None):
+        """
+        :param playouts: budget of rollouts, 1000 when neither budget is given.
+        :param time_limit: seconds.
+        :return: MCTSResult, its move is None when player has no move.
+        :raises ValueError: for a position of another board than 8x8.
+        """
+        if position.SIZE != BitBoard.SIZE:
+            raise ValueError(f"MCTS supports only the {BitBoard.SIZE}x{BitBoard.SIZE} board")
+        if playouts is None and time_limit is None:
+            playouts = 1000
+        start = time.perf_counter()
+        deadline = start + time_limit if time_limit is not None else None
+
+        root = self.root.find(position, player) if self.root is not None else None
+        if root is None:
+            root = Node(position, player)
+        root.parent = None
+
+        if not root.untried and not root.children:
+            return MCTSResult(None, {}, 0.0, 0, 0.0)
+
+        done = 0
+        while (playouts is None or done < playouts) and (deadline is None or time.perf_counter() < deadline):
+            done += self._playout(root)
+
+        best = max(root.children, key=lambda c: c.visits)
+        self.root = best
+        visits = {pack(child.move): child.visits for child in root.children}
+        return MCTSResult(best.move, visits, best.score / best.visits, done, time.perf_counter() - start)
+
+    def _playout(self, root):
+        node = root
+        while not node.untried and node.children:
+            node = node.select(self.exploration)
+
+        if node.untried:
+            move = node.untried.pop(self.random.randrange(len(node.untried)))
+            child = Node(node.position.apply(move, node.player), node.player.opponent, move, node)
+            node.children.append(child)
+            node = child
+
+        results = self._rollouts(node)
+        for result in results:
+            self._backpropagate(node, result)
+        return len(results)
+
+    def _rollouts(self, node):
+        """:return: results of rollouts from node, 1 white won, -1 red won, 0 a draw."""
+        if not node.untried and not node.children:
+            return [-1 if node.player == Player.white else 1]
+
+        if self.batch_size > 1:
+            batch = BatchBoard.from_positions([(node.position, node.player)] * self.batch_size)
+            return play_out(batch, self.random_state, self.rollout_plies).tolist()
+
+        position, player = node.position, node.player
+        for _ in range(self.rollout_plies):
+            moves = position.generate(player)
+            if not moves:
+                return [-1 if player == Player.white else 1]
+            position = position.apply(self.policy(position, player, moves, self.random), player)
+            player = player.opponent
+        return [0]
+
+    @staticmethod
+    def _backpropagate(node, result):
+        while node is not None:
+            node.visits += 1
+            # the player who moved into the node
+            mover = node.player.opponent
+            node.score += (1 + (result if mover == Player.white else -result)) / 2
+            node = node.parent
+
+
+def root_search(position, player, playouts=None, time_limit=None, seed=None, **options):
+    """
+    Independent search of a worker process.
+    :return: {packed move: (move, visits, score)} of the root moves, playouts.
+    """
+    mcts = MCTS(seed=seed, **options)
+    result = mcts.search(position, player, playouts, time_limit)
+    if result.move is None:
+        return {}, 0
+    children = mcts.root.parent.children
+    return {pack(c.move): (c.move, c.visits, c.score) for c in children}, result.playouts
+
+
+def parallel_search(executor, workers, position, player, playouts=None, time_limit=None, seed=0, **options):
+    """
+    Root parallelism: every worker searches the position with its own seed and a share of playouts.
+    :param executor: concurrent.futures executor of worker processes.
+    :return: MCTSResult of the move with the most visits in all searches together.
+    """
+    start = time.perf_counter()
+    share = -(-playouts // workers) if playouts is not None else None
+    futures = [executor.submit(root_search, position, player, share, time_limit, seed + i, **options)
+               for i in range(workers)]
+
+    stats, done = {}, 0
+    for future in futures:
+        children, worker_playouts = future.result()
+        for packed, (move, visits, score) in children.items():
+            total = stats.setdefault(packed, [move, 0, 0.0])
+            total[1] += visits
+            total[2] += score
+        done += worker_playouts
+
+    elapsed = time.perf_counter() - start
+    if not stats:
+        return MCTSResult(None, {}, 0.0, done, elapsed)
+    move, visits, score = max(stats.values(), key=lambda s: s[1])
+    return MCTSResult(move, {packed: s[1] for packed, s in stats.items()}, score / visits, done, elapsed)
@@ -0,0 +1,273 @@
+"""
+Portable Draughts Notation import and export.
+
+Games are streamed: a file is read line by line and only one game is held at a time.
+Squares are numbered 1..32 as in model.records, the first player (white here) starts on 1..12
+and is written as B in FEN tags, as in PDN of English checkers. Moves are written as 9-14
+and captures as 18x11x2; a capture may omit its intermediate squares when it is still unambiguous.
+Results are from the first player's point of view: 1-0, 0-1 or 1/2-1/2, * when unknown.
+
+Every move is validated against MovesGenerator and a game is yielded as (headers, moves),
+headers being an ordered dict of tags and moves a list of paths, see model.bitboard.
+"""
+import os
+import re
+from collections import OrderedDict, deque
+from concurrent.futures import ProcessPoolExecutor
+
+from model.bitboard import BitBoard
+from model.game import Game
+from model.generator import MovesGenerator
+from model.items import Board, Player, EndGameEvent
+from model.records import to_fen, from_fen
+
+PDN_SIDES = {Player.white: 'B', Player.red: 'W'}
+RESULTS = {Player.white: '1-0', Player.red: '0-1', None: '1/2-1/2'}
+_RESULT_TOKENS = {'1-0', '0-1', '1/2-1/2', '2-0', '0-2', '1-1', '*'}
+
+_TAG = re.compile(r'\[\s*(\w+)\s+"((?:[^"\\]|\\.)*)"\s*\]')
+_COMMENTS = re.compile(r'\{[^}]*\}|;[^\n]*')
+_TOKENS = re.compile(r'\d+\s*[x\-:]\s*\d+(?:\s*[x:]\s*\d+)*|\d+\.+|[()]|\$\d+|[^\s()]+')
+_LINE_LENGTH = 79
+
+
+class PDNError(ValueError):
+    pass
+
+
+def read_raw(lines):
+    """
+    Splits a stream of lines into games.
+    :return: generator of (headers, movetext) pairs, nothing is validated.
+    """
+    headers, movetext = OrderedDict(), []
+    in_comment = False
+
+    for line in lines:
+        stripped = line.strip()
+        if not in_comment and stripped.startswith('['):
+            if movetext:
+                yield headers, "\n".join(movetext)
+                headers, movetext = OrderedDict(), []
+            for tag, value in _TAG.findall(stripped):
+                headers[tag] = re.sub(r'\\(.)', r'\1', value)
+            continue
+        if stripped.startswith('%'):
+            continue
+
+        if stripped:
+            movetext.append(stripped)
+            in_comment = stripped.count('{') > stripped.count('}') or in_comment and '}' not in stripped
+            if not in_comment and _is_result(stripped.split()[-1]):
+                yield headers, "\n".join(movetext)
+                headers, movetext = OrderedDict(), []
+
+    if movetext or headers:
+        yield headers, "\n".join(movetext)
+
+
+def parse_game(headers, movetext):
+    """
+    Moves of a game validated against MovesGenerator.
+    :return: (headers, moves).
+    :raise PDNError: an illegal or ambiguous move.
+    """
+    game = Game(MovesGenerator)
+    if 'FEN' in headers:
+        try:
+            position, player = from_fen(headers['FEN'], PDN_SIDES)
+        except ValueError as e:
+            raise PDNError(str(e)) from e
+        game.board, game.current_player = Board.from_masks(position.masks()), player
+        if player == Player.red:
+            game.board.toggle_side()
+
+    moves = []
+    for token in _move_tokens(movetext):
+        try:
+            move = find_move(game, token)
+        except EndGameEvent:
+            raise PDNError(f"Move {token} after the end of the game") from None
+
+        moves.append(move.path[0])
+        game.play(move)
+
+    return headers, moves
+
+
+def find_move(game, token):
+    """
+    :return: Move of game.get_possible_moves() written as token, 9-14 or 18x11x2 for example.
+    :raise PDNError: no such move or more of them.
+    """
+    try:
+        squares = [int(s) - 1 for s in re.split(r'\s*[x\-:]\s*', token.strip())]
+    except ValueError:
+        raise PDNError(f"Invalid move {token!r}") from None
+
+    matching = [move for moves in game.get_possible_moves().values() for move in moves
+                if _matches(move.path[0], squares)]
+    if len(matching) != 1:
+        reason = "Illegal" if not matching else "Ambiguous"
+        fen = to_fen(game.board, game.current_player, PDN_SIDES)
+        raise PDNError(f"{reason} move {token} in position {fen}")
+    return matching[0]
+
+
+def format_move(move):
+    """:param move: (path, captured) tuple of model.bitboard or a Move."""
+    path, captured = move if isinstance(move, tuple) else move.path
+    return ("x" if captured else "-").join(str(s + 1) for s in path)
+
+
+def read_games(lines, skip_invalid=False):
+    """
+    :param lines: iterable of lines, an open file for example.
+    :param skip_invalid: drop games with illegal moves instead of raising PDNError.
+    :return: generator of (headers, moves).
+    """
+    for number, (headers, movetext) in enumerate(read_raw(lines)):
+        try:
+            yield parse_game(headers, movetext)
+        except PDNError as e:
+            if not skip_invalid:
+                raise PDNError(f"Game {number}: {e}") from e
+
+
+def read_file(path, workers=None, chunk_size=500, skip_invalid=False):
+    """
+    The same as read_games() for a file, games are validated in a process pool
+    and yielded in their order. Only a few chunks per worker are read ahead.
+    """
+    with open(path) as f, ProcessPoolExecutor(max_workers=workers) as executor:
+        pending = deque()
+        limit = 2 * (workers or os.cpu_count() or 1)
+
+        chunk = []
+        for raw in read_raw(f):
+            chunk.append(raw)
+            if len(chunk) == chunk_size:
+                pending.append(executor.submit(_parse_chunk, chunk, skip_invalid))
+                chunk = []
+                if len(pending) >= limit:
+                    yield from pending.popleft().result()
+        if chunk:
+            pending.append(executor.submit(_parse_chunk, chunk, skip_invalid))
+
+        while pending:
+            yield from pending.popleft().result()
+
+
+def _parse_chunk(chunk, skip_invalid):
+    return list(read_games(_join(chunk), skip_invalid))
+
+
+def _join(chunk):
+    # raw games are sent to workers as they are and split again there
+    for headers, movetext in chunk:
+        yield from (_tag(tag, value) for tag, value in headers.items())
+        yield movetext
+
+
+def format_game(headers, moves, position=None, player=Player.white):
+    """
+    PDN text of a game.
+    :param moves: paths or (path, captured) tuples of model.bitboard.
+    :param position: start BitBoard, a FEN tag is written when it is not the initial position.
+        When None, the game starts from the FEN tag of headers or from the initial position.
+    """
+    headers = OrderedDict(headers)
+    if position is None and 'FEN' in headers:
+        try:
+            position, player = from_fen(headers['FEN'], PDN_SIDES)
+        except ValueError as e:
+            raise PDNError(str(e)) from e
+    position = position if position is not None else BitBoard.initial()
+    if position != BitBoard.initial() or player != Player.white:
+        headers['FEN'] = to_fen(position, player, PDN_SIDES)
+    result = headers.setdefault('Result', '*')
+
+    lines = [_tag(tag, value) for tag, value in headers.items()]
+    lines.append("")
+
+    tokens, number = [], 1
+    for move in moves:
+        path = move[0] if isinstance(move[0], tuple) else move
+        legal = _legal_move(position, player, path)
+        if player == Player.white:
+            tokens.append(f"{number}.")
+        elif not tokens:
+            tokens.append(f"{number}...")
+        tokens.append(format_move(legal))
+
+        if player == Player.red:
+            number += 1
+        position, player = position.apply(legal, player), player.opponent
+    tokens.append(result)
+
+    line = ""
+    for token in tokens:
+        if line and len(line) + 1 + len(token) > _LINE_LENGTH:
+            lines.append(line)
+            line = token
+        else:
+            line = f"{line} {token}" if line else token
+    lines.append(line)
+    return "\n".join(lines) + "\n\n"
+
+
+def _legal_move(position, player, path):
+    for move in position.generate(player):
+        if move[0] == path:
+            return move
+    raise PDNError(f"Illegal move {format_move((path, ()))} of {player.name}")
+
+
+def game_record(game, **headers):
+    """(headers, moves) of a Game played from the initial position, its result taken from game.winner."""
+    headers = OrderedDict(headers)
+    if getattr(game, 'finished', False):
+        headers.setdefault('Result', RESULTS[game.winner])
+    return headers, game.moves()
+
+
+def write_games(f, records):
+    """
+    Streams games to an open text file.
+    :param records: iterable of (headers, moves), game_record() of Games for example.
+    """
+    for headers, moves in records:
+        f.write(format_game(headers, moves))
+
+
+def _tag(tag, value):
+    value = str(value).replace('\\', '\\\\').replace('"', '\\"')
+    return f'[{tag} "{value}"]'
+
+
+def _move_tokens(movetext):
+    text = _COMMENTS.sub(" ", movetext)
+    depth = 0
+    for token in _TOKENS.findall(text):
+        if token == '(':
+            depth += 1
+        elif token == ')':
+            depth -= 1
+        elif depth or token[0] == '$' or token.endswith('.') or _is_result(token):
+            continue
+        elif token[0].isdigit():
+            yield token
+        else:
+            raise PDNError(f"Unexpected token {token!r}")
+
+
+def _is_result(token):
+    return token in _RESULT_TOKENS
+
+
+def _matches(path, squares):
+    """True when squares are the path, or its start, end and some of the squares in between, in order."""
+    if path[0] != squares[0] or path[-1] != squares[-1]:
+        return False
+    rest = iter(path[1:-1])
+    return all(square in rest for square in squares[1:-1])
@@ -0,0 +1,189 @@
+"""
+Computer players. Every player chooses a complete move, with all its following moves, for a Game.
+"""
+import random
+from concurrent.futures import ProcessPoolExecutor
+
+from model.bitboard import BitBoard, to_move
+from model.mcts import MCTS, POLICIES, parallel_search
+from model.evaluation import evaluate_move
+from model.search import Searcher, TranspositionTable
+from model.smp import SharedTranspositionTable, lazy_smp
+
+
+class ComputerPlayer:
+    # sizes of boards the player plays on, None for any, evaluation and searches are made for the 8x8 board
+    board_sizes = (BitBoard.SIZE,)
+
+    def __init__(self):
+        self.nodes = 0
+
+    def choose(self, game):
+        """:return: Move of game.get_possible_moves() to be made with Game.play()."""
+        raise NotImplementedError()
+
+    def close(self):
+        """Releases worker processes and shared memory of the player."""
+        pass
+
+
+class RandomPlayer(ComputerPlayer):
+    board_sizes = None
+
+    def __init__(self, seed=None):
+        super().__init__()
+        self.random = random.Random(seed)
+
+    def choose(self, game):
+        all_moves = [move for moves in game.get_possible_moves().values() for move in moves]
+        self.nodes += len(all_moves)
+        return self.random.choice(all_moves)
+
+
+class GreedyPlayer(ComputerPlayer):
+    """Chooses the move with the best static evaluation after it, see evaluate_move(), ties are broken randomly."""
+
+    def __init__(self, seed=None):
+        super().__init__()
+        self.random = random.Random(seed)
+
+    def choose(self, game):
+        _check_board(self, game)
+        position = BitBoard.from_board(game.board)
+        player = game.current_player
+
+        scored = []
+        for moves in game.get_possible_moves().values():
+            for move in moves:
+                scored.append((evaluate_move(position, move.path, player), move))
+        self.nodes += len(scored)
+
+        best = max(score for score, _ in scored)
+        return self.random.choice([move for score, move in scored if score == best])
+
+
+class SearchPlayer(ComputerPlayer):
+    def __init__(self, depth=None, time_limit=None, table_bits=18, tablebase=None, book=None, workers=1):
+        """:param workers: processes of lazy SMP search sharing a table, without a tablebase and a book."""
+        super().__init__()
+        self.depth = depth
+        self.time_limit = time_limit
+        self.workers = workers
+        if workers > 1:
+            self.table = SharedTranspositionTable(table_bits)
+            self.executor = ProcessPoolExecutor(max_workers=workers)
+        else:
+            self.executor = None
+            self.searcher = Searcher(TranspositionTable(table_bits), tablebase=tablebase, book=book)
+
+    def choose(self, game):
+        _check_board(self, game)
+        if self.executor is None:
+            result = self.searcher.search(game, self.depth, self.time_limit)
+            self.nodes += result.nodes
+            return result.move
+
+        square = game.piece_to_continue.square if game.piece_to_continue else None
+        result = lazy_smp(self.executor, self.workers, self.table, BitBoard.from_board(game.board),
+                          game.current_player, square, self.depth, self.time_limit)
+        self.nodes += result.nodes
+        if result.path is None:
+            # raises EndGameEvent
+            game.get_possible_moves()
+        return to_move(game.board, result.path)
+
+    def close(self):
+        if self.executor is not None:
+            self.executor.shutdown()
+            self.table.close()
+
+
+class MCTSPlayer(ComputerPlayer):
+    def __init__(self, playouts=None, time_limit=None, workers=1, seed=None, **options):
+        """
+        :param workers: processes of root parallel search, the tree is reused between moves only with one.
+        :param options: of model.mcts.MCTS, policy, batch_size, exploration or rollout_plies.
+        """
+        super().__init__()
+        self.playouts = playouts
+        self.time_limit = time_limit
+        self.workers = workers
+        self.seed = seed if seed is not None else 0
+        self.options = options
+        self.mcts = MCTS(seed=seed, **options)
+        self.executor = ProcessPoolExecutor(max_workers=workers) if workers > 1 else None
+        self.last = None
+
+    def choose(self, game):
+        _check_board(self, game)
+        position, player = BitBoard.from_board(game.board), game.current_player
+        if self.executor is not None:
+            self.seed += self.workers
+            self.last = parallel_search(self.executor, self.workers, position, player, self.playouts,
+                                        self.time_limit, self.seed, **self.options)
+        else:
+            self.last = self.mcts.search(position, player, self.playouts, self.time_limit)
+
+        self.nodes += self.last.playouts
+        if self.last.move is None:
+            # raises EndGameEvent
+            game.get_possible_moves()
+        return to_move(game.board, self.last.move)
+
+    def close(self):
+        if self.executor is not None:
+            self.executor.shutdown()
+
+
+def _check_board(player, game):
+    if player.board_sizes is not None and game.board.size not in player.board_sizes:
+        raise ValueError(f"{type(player).__name__} does not play on the {game.board.size}x{game.board.size} board")
+
+
+def parse_player(spec):
+    """
+    Checks a create_player() specification without creating the player, nothing is started.
+    :return: (player class, keyword arguments of it).
+    :raises ValueError: for an unknown or invalid specification.
+    """
+    name, _, arg = spec.partition(':')
+    if name == 'random':
+        return RandomPlayer, {}
+    elif name == 'greedy':
+        return GreedyPlayer, {}
+    elif name == 'search':
+        budget, _, workers = arg.partition(':')
+        workers = int(workers) if workers else 1
+        if workers < 1:
+            raise ValueError(f"Invalid number of workers: {workers}")
+        if budget.endswith('s'):
+            return SearchPlayer, {'time_limit': float(budget[:-1]), 'workers': workers}
+        return SearchPlayer, {'depth': int(budget) if budget else None, 'workers': workers}
+    elif name == 'mcts':
+        budget, _, policy = arg.partition(':')
+        options = {}
+        if policy:
+            if policy not in POLICIES:
+                raise ValueError(f"Unknown policy: {policy}")
+            options['policy'] = POLICIES[policy]
+        if budget.endswith('s'):
+            return MCTSPlayer, dict(options, time_limit=float(budget[:-1]))
+        return MCTSPlayer, dict(options, playouts=int(budget) if budget else None)
+    raise ValueError(f"Unknown player: {spec}")
+
+
+def create_player(spec, seed=None, book=None, size=BitBoard.SIZE):
+    """
+    Player from a textual specification, usable across processes:
+        random, greedy, search:<depth>, search:<seconds>s, search:<budget>:<workers> for lazy SMP,
+        mcts:<playouts> or mcts:<seconds>s, mcts:<budget>:greedy for greedy rollouts
+    :param book: model.book.OpeningBook of search players.
+    :param size: of the board the player plays on, only the random player plays on boards other than 8x8.
+    :raises ValueError: for an unknown or invalid specification, see parse_player(), or an unsupported size.
+    """
+    cls, options = parse_player(spec)
+    if cls.board_sizes is not None and size not in cls.board_sizes:
+        raise ValueError(f"Player {spec} does not play on the {size}x{size} board")
+    if cls is SearchPlayer:
+        return cls(book=book, **options)
+    return cls(seed=seed, **options)
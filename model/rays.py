@@ -0,0 +1,104 @@
+"""
+Diagonal rays of the board, built once for every board size.
+
+Playable squares are numbered row by row, see model.bitboard. For every playable square and every
+direction a ray holds the squares met when sliding from it to the edge of the board, nearest first.
+Moves of men, slides of kings and landing squares of captures are all slices of these rays.
+
+Geometry holds the squares and rays of a board of any even size, geometry(10) is the board of
+international draughts. Module level names are those of the standard 8x8 board.
+"""
+
+# order here matters, the same as in BoardMember.get_my_diagonal_neighbours
+NW, NE, SE, SW = range(4)
+VECTORS = ((-1, -1), (-1, 1), (1, 1), (1, -1))
+DIRECTIONS = {'nwse': (NW, NE, SE, SW), 'n': (NW, NE), 's': (SW, SE),
+              'nw': (NW,), 'ne': (NE,), 'se': (SE,), 'sw': (SW,)}
+
+
+class Geometry:
+    """Squares and rays of a board of rows x rows fields."""
+
+    def __init__(self, rows):
+        if rows < 4 or rows % 2:
+            raise ValueError(f"Unsupported board size {rows}")
+        self.rows = rows
+        self.squares = rows * rows // 2
+        self._half = rows // 2
+
+        # rays[direction][square] -> squares
+        self.rays = self._build_rays()
+        # neighbours[direction][square] -> nearest square or -1
+        self.neighbours = tuple(tuple(ray[0] if ray else -1 for ray in rays) for rays in self.rays)
+        # addr_rays[(row, col)][direction] -> (row, col) addresses, the same rays for the object board
+        self.addr_rays = {self.square_addr(square): tuple(tuple(self.square_addr(s) for s in self.rays[d][square])
+                                                          for d in range(len(VECTORS)))
+                          for square in range(self.squares)}
+
+    def __repr__(self):
+        return f"Geometry({self.rows})"
+
+    # geometries are shared, copies of boards and pieces refer to the same one
+    def __deepcopy__(self, memo):
+        return self
+
+    def __reduce__(self):
+        return geometry, (self.rows,)
+
+    def square_index(self, row, col):
+        return row * self._half + col // 2
+
+    def square_addr(self, square):
+        row = square // self._half
+        return row, 2 * (square % self._half) + (row + 1) % 2
+
+    def _build_rays(self):
+        rays = tuple([] for _ in VECTORS)
+
+        for square in range(self.squares):
+            row, col = self.square_addr(square)
+            for d, (dr, dc) in enumerate(VECTORS):
+                ray = []
+                r, c = row + dr, col + dc
+                while 0 <= r < self.rows and 0 <= c < self.rows:
+                    ray.append(self.square_index(r, c))
+                    r, c = r + dr, c + dc
+                rays[d].append(tuple(ray))
+
+        return tuple(tuple(r) for r in rays)
+
+
+_geometries = {}
+
+
+def geometry(rows=8):
+    """Geometry of the board size, built once."""
+    result = _geometries.get(rows)
+    if result is None:
+        result = _geometries[rows] = Geometry(rows)
+    return result
+
+
+STANDARD = geometry(8)
+
+ROWS = STANDARD.rows
+SQUARES = STANDARD.squares
+
+
+def square_index(row, col):
+    return row * (ROWS // 2) + col // 2
+
+
+def square_addr(square):
+    row = square // (ROWS // 2)
+    return row, 2 * (square % (ROWS // 2)) + (row + 1) % 2
+
+
+# RAYS[direction][square] -> squares
+RAYS = STANDARD.rays
+
+# NEIGHBOURS[direction][square] -> nearest square or -1
+NEIGHBOURS = STANDARD.neighbours
+
+# ADDR_RAYS[(row, col)][direction] -> (row, col) addresses
+ADDR_RAYS = STANDARD.addr_rays
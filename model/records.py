@@ -0,0 +1,228 @@
+"""
+Compact records of positions and games.
+
+A position of the 8x8 board with the side to move is 16 bytes: white men, red men, white kings and red kings masks
+of model.bitboard as little endian 32-bit words. A white man is crowned on the last row, so the
+highest bit of white men is free and tells that red is to move. Its text form is FEN-like:
+
+    W:W1,2,K7:R30,K32
+
+side to move, then white and red pieces on squares numbered 1..32 as in model.bitboard plus one,
+kings prefixed by K.
+
+GameStore keeps games in an append-only data file and an index of their offsets. A game is its
+start position, the number of moves and the moves, each one a byte of the number of visited squares
+followed by the squares. Both files are read through mmap. Positions inside a game are not stored,
+they are found by replaying its moves from the start position.
+"""
+import mmap
+import os
+import struct
+
+from model.bitboard import BitBoard, PROMOTION_ROW, squares
+from model.items import Board, Player
+from model.rays import SQUARES
+
+POSITION = struct.Struct('<4I')
+_RED_TO_MOVE = 1 << (SQUARES - 1)
+_MOVES = struct.Struct('<H')
+_OFFSET = struct.Struct('<Q')
+
+SIDES = {Player.white: 'W', Player.red: 'R'}
+
+
+def to_bytes(position, player):
+    """
+    :param position: BitBoard or Board.
+    :return: 16 bytes.
+    """
+    if isinstance(position, Board):
+        position = BitBoard.from_board(position)
+    if position.SIZE != BitBoard.SIZE:
+        raise ValueError(f"Position of the {position.SIZE}x{position.SIZE} board can not be stored")
+    white_men, red_men, white_kings, red_kings = position.masks()
+    if white_men & PROMOTION_ROW[Player.white]:
+        raise ValueError("White man on the last row can not be stored")
+
+    if player == Player.red:
+        white_men |= _RED_TO_MOVE
+    return POSITION.pack(white_men, red_men, white_kings, red_kings)
+
+
+def from_bytes(data, offset=0):
+    """:return: (BitBoard, Player to move) stored by to_bytes()."""
+    white_men, red_men, white_kings, red_kings = POSITION.unpack_from(data, offset)
+    player = Player.red if white_men & _RED_TO_MOVE else Player.white
+    return BitBoard(white_men & ~_RED_TO_MOVE, red_men, white_kings, red_kings), player
+
+
+def to_fen(position, player, sides=SIDES):
+    """
+    :param position: BitBoard or Board.
+    :param sides: letters of players.
+    """
+    if isinstance(position, Board):
+        position = BitBoard.from_board(position)
+
+    parts = [sides[player]]
+    for side in Player:
+        men, kings = position.men(side), position.kings(side)
+        pieces = [str(s + 1) if men >> s & 1 else f"K{s + 1}" for s in squares(men | kings)]
+        parts.append(sides[side] + ",".join(pieces))
+    return ":".join(parts)
+
+
+def from_fen(text, sides=SIDES):
+    """:return: (BitBoard, Player to move) of a to_fen() text."""
+    players = {letter: player for player, letter in sides.items()}
+    try:
+        side, *pieces = text.strip().split(':')
+        player = players[side.upper()]
+
+        masks = {(p, king): 0 for p in Player for king in (False, True)}
+        for part in pieces:
+            owner = players[part[0].upper()]
+            for item in filter(None, part[1:].split(',')):
+                king = item[0].upper() == 'K'
+                square = int(item[1:] if king else item) - 1
+                if not 0 <= square < SQUARES:
+                    raise ValueError(f"Square out of board: {item}")
+                masks[owner, king] |= 1 << square
+    except (KeyError, IndexError, ValueError) as e:
+        raise ValueError(f"Invalid position: {text!r}") from e
+
+    return BitBoard(masks[Player.white, False], masks[Player.red, False],
+                    masks[Player.white, True], masks[Player.red, True]), player
+
+
+def to_board(data):
+    """:return: (Board, Player to move) of to_bytes() data."""
+    position, player = from_bytes(data)
+    return Board.from_masks(position.masks()), player
+
+
+class GameStore:
+    """
+    Append-only store of games, with random access to any game and any position of it.
+    Moves are (path, captured) tuples of model.bitboard, only their paths are stored.
+    """
+
+    def __init__(self, path):
+        """:param path: data file, the index is kept next to it in path + '.idx'."""
+        self.path = path
+        self.data = open(path, 'a+b')
+        self.index = open(path + '.idx', 'a+b')
+        self._maps = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def __len__(self):
+        return os.fstat(self.index.fileno()).st_size // _OFFSET.size
+
+    def close(self):
+        self._unmap()
+        self.data.close()
+        self.index.close()
+
+    def append(self, moves, position=None, player=Player.white):
+        """
+        Append a game.
+        :param moves: (path, captured) tuples or paths, complete moves from the start position.
+        :param position: start BitBoard, the initial position by default.
+        :return: number of the game.
+        """
+        position = position if position is not None else BitBoard.initial()
+
+        record = bytearray(to_bytes(position, player))
+        record += _MOVES.pack(len(moves))
+        for move in moves:
+            path = move[0] if isinstance(move[0], tuple) else move
+            record.append(len(path))
+            record += bytes(path)
+
+        self._unmap()
+        self.data.seek(0, os.SEEK_END)
+        offset = self.data.tell()
+        self.data.write(record)
+        self.data.flush()
+
+        self.index.seek(0, os.SEEK_END)
+        self.index.write(_OFFSET.pack(offset))
+        self.index.flush()
+        return len(self) - 1
+
+    def append_game(self, game):
+        """
+        Append the moves played in a Game, model.game.Game.moves(), from the position it started in:
+        the board with all its moves undone, the initial one or any other, a TailoredBoard for example.
+        Only games on the 8x8 board between complete moves can be stored, ValueError is raised otherwise.
+        """
+        if game.board.size != BitBoard.SIZE:
+            raise ValueError(f"Games on the {game.board.size}x{game.board.size} board can not be stored")
+        if game.piece_to_continue is not None:
+            raise ValueError("Game in the middle of a capture can not be stored")
+
+        board = game.board.clone()
+        while board.history:
+            board.undo()
+        player = game.history[0][0] if game.history else game.current_player
+        return self.append(game.moves(), BitBoard.from_board(board), player)
+
+    def start(self, k):
+        """:return: (BitBoard, Player) the k-th game starts from."""
+        data, offset = self._record(k)
+        return from_bytes(data, offset)
+
+    def moves(self, k):
+        """:return: paths of moves of the k-th game."""
+        data, offset = self._record(k)
+        offset += POSITION.size
+        n, = _MOVES.unpack_from(data, offset)
+        offset += _MOVES.size
+
+        result = []
+        for _ in range(n):
+            length = data[offset]
+            result.append(tuple(data[offset + 1:offset + 1 + length]))
+            offset += 1 + length
+        return result
+
+    def position(self, k, ply):
+        """
+        Only paths of moves are stored, so the position is found by replaying the game from its start,
+        generating moves at every ply: the cost grows with ply. Use positions() to visit all of them.
+        :return: (BitBoard, Player to move) after ply moves of the k-th game.
+        """
+        for i, result in enumerate(self.positions(k)):
+            if i == ply:
+                return result
+        raise IndexError(f"Game {k} has no ply {ply}")
+
+    def positions(self, k):
+        """:return: iterator of (BitBoard, Player to move) of the k-th game from its start to its end, one replay."""
+        position, player = self.start(k)
+        yield position, player
+        for path in self.moves(k):
+            move = next(m for m in position.generate(player) if m[0] == path)
+            position, player = position.apply(move, player), player.opponent
+            yield position, player
+
+    def _record(self, k):
+        if not 0 <= k < len(self):
+            raise IndexError(f"Game {k} is not in the store")
+        if self._maps is None:
+            self._maps = tuple(mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) for f in (self.data, self.index))
+
+        data, index = self._maps
+        offset, = _OFFSET.unpack_from(index, k * _OFFSET.size)
+        return data, offset
+
+    def _unmap(self):
+        if self._maps is not None:
+            for m in self._maps:
+                m.close()
+            self._maps = None
@@ -0,0 +1,297 @@
+"""
+Alpha-beta search engine.
+
+Negamax alpha-beta with iterative deepening and a transposition table, searching BitBoard positions.
+One ply is a complete move, a whole capture sequence included. Leaves with a capture available
+are searched further, since captures are forced. Positions found in an endgame tablebase are not searched,
+their score follows from the known result and distance. Positions of an opening book are not searched at all,
+the most played move is returned.
+
+The evaluation and packed moves of the transposition table are those of the 8x8 board, positions
+of other sizes are refused with ValueError.
+"""
+import time
+
+from model.bitboard import BitBoard, PROMOTION_ROW, count, pack
+from model.evaluation import DEFAULT_WEIGHTS, evaluate
+from model.rays import square_addr
+from model.tablebase import WIN as TABLE_WIN, LOSS as TABLE_LOSS
+
+WIN = 100000
+MAN_VALUE = DEFAULT_WEIGHTS.man
+KING_VALUE = DEFAULT_WEIGHTS.king
+QUIESCENCE_LIMIT = 8
+
+EXACT, LOWER, UPPER = range(3)
+
+
+class TranspositionTable:
+    """
+    Fixed size table of (key, depth, score, bound, packed move, generation) entries, indexed by low bits of the key.
+    A slot is overwritten by an entry of the same position, a deeper or equally deep search
+    or when the stored entry comes from an earlier search.
+    """
+
+    def __init__(self, size_bits=18):
+        self.mask = (1 << size_bits) - 1
+        self.entries = [None] * (1 << size_bits)
+        self.generation = 0
+
+    def new_search(self):
+        self.generation += 1
+
+    def stopped(self):
+        """True when a search using the table should stop, as by its time limit."""
+        return False
+
+    def probe(self, key):
+        entry = self.entries[key & self.mask]
+        if entry is not None and entry[0] == key:
+            return entry
+        return None
+
+    def store(self, key, depth, score, bound, move):
+        index = key & self.mask
+        entry = self.entries[index]
+        if entry is None or entry[0] == key or entry[5] != self.generation or depth >= entry[1]:
+            self.entries[index] = (key, depth, score, bound, move, self.generation)
+
+
+class SearchResult:
+    def __init__(self, move, path, score, depth, nodes, elapsed):
+        """
+        :param move: best Move of the searched Game, with its following moves.
+        :param path: the same move as a (path, captured) tuple of BitBoard.
+        :param score: score from the point of view of the player to move,
+            None if the move was forced or taken from the book.
+        """
+        self.move = move
+        self.path = path
+        self.score = score
+        self.depth = depth
+        self.nodes = nodes
+        self.elapsed = elapsed
+
+    def __repr__(self):
+        return f"{self.move} score: {self.score}, depth: {self.depth}, nodes: {self.nodes}, " \
+               f"{self.nodes_per_second:.0f} nodes/s"
+
+    @property
+    def nodes_per_second(self):
+        return self.nodes / self.elapsed if self.elapsed else 0.0
+
+
+class _Timeout(Exception):
+    pass
+
+
+class Searcher:
+    def __init__(self, table=None, evaluation=evaluate, tablebase=None, book=None):
+        """
+        :param tablebase: model.tablebase.Tablebase probed below the root.
+        :param book: model.book.OpeningBook probed at the root.
+        """
+        self.table = table if table is not None else TranspositionTable()
+        self.evaluation = evaluation
+        self.tablebase = tablebase
+        self.book = book
+        self.history = {}
+        self.nodes = 0
+        self.deadline = None
+        self.halted = False
+
+    def search(self, game, depth=None, time_limit=None):
+        """
+        Best move of the player to move in game.
+        :param depth: maximal depth of iterative deepening, in plies.
+        :param time_limit: seconds, the last completed iteration is used when the time is over.
+        :return: SearchResult
+        """
+        position = BitBoard.from_board(game.board)
+        square = game.piece_to_continue.square if game.piece_to_continue else None
+
+        result = self.search_position(position, game.current_player, square, depth, time_limit)
+        result.move = self._to_game_move(game, result.path)
+        return result
+
+    def search_position(self, position, player, square=None, depth=None, time_limit=None, stop=None):
+        """
+        The same as search() for a BitBoard position, result.move is left None.
+        :param stop: function (depth, move, score, elapsed) called after every completed iteration,
+            the search ends when it returns True.
+        :raises ValueError: for a position of another board than 8x8, the evaluation is made for it.
+        """
+        if position.SIZE != BitBoard.SIZE:
+            raise ValueError(f"Search supports only the {BitBoard.SIZE}x{BitBoard.SIZE} board")
+        if depth is None and time_limit is None:
+            depth = 6
+
+        start = time.perf_counter()
+        self.deadline = start + time_limit if time_limit is not None else None
+        self.halted = False
+        self.nodes = 0
+        self.table.new_search()
+
+        moves = position.generate(player, square)
+        if not moves:
+            return SearchResult(None, None, -WIN, 0, 0, 0.0)
+        if len(moves) == 1:
+            return SearchResult(None, moves[0], None, 0, 0, time.perf_counter() - start)
+        if self.book is not None and square is None:
+            move = self.book.best(position, player)
+            if move is not None:
+                return SearchResult(None, move, None, 0, 0, time.perf_counter() - start)
+
+        key = position.key(player, square)
+        best, score, completed = moves[0], None, 0
+        current = 1
+        while depth is None or current <= depth:
+            try:
+                score, best = self._root(position, player, key, moves, current)
+            except _Timeout:
+                break
+            completed = current
+            if abs(score) >= WIN - 1000:
+                break
+            if stop is not None and stop(current, best, score, time.perf_counter() - start):
+                break
+            current += 1
+
+        return SearchResult(None, best, score, completed, self.nodes, time.perf_counter() - start)
+
+    def stop(self):
+        """Stops a search running in another thread, its last completed iteration is used."""
+        self.halted = True
+
+    def _root(self, position, player, key, moves, depth):
+        alpha, beta = -WIN - 1, WIN + 1
+        best = None
+
+        for move in self._order(moves, self.table.probe(key), position, player):
+            child = position.apply(move, player)
+            score = -self._negamax(child, player.opponent, position.next_key(key, move, player),
+                                   depth - 1, -beta, -alpha, 1)
+            if score > alpha:
+                alpha, best = score, move
+
+        self.table.store(key, depth, alpha, EXACT, pack(best))
+        return alpha, best
+
+    def _negamax(self, position, player, key, depth, alpha, beta, ply):
+        self.nodes += 1
+        if not self.nodes & 1023 and (self.halted or self.table.stopped() or
+                                      self.deadline is not None and time.perf_counter() > self.deadline):
+            raise _Timeout()
+
+        if self.tablebase is not None and count(position.occupied) <= self.tablebase.max_pieces:
+            probe = self.tablebase.probe(position, player)
+            if probe is not None:
+                return _from_tablebase(*probe, ply)
+
+        alpha_orig = alpha
+        entry = self.table.probe(key)
+        if entry is not None and entry[1] >= depth:
+            score, bound = _from_table(entry[2], ply), entry[3]
+            if bound == EXACT:
+                return score
+            elif bound == LOWER:
+                alpha = max(alpha, score)
+            else:
+                beta = min(beta, score)
+            if alpha >= beta:
+                return score
+
+        moves = position.generate(player)
+        if not moves:
+            return -WIN + ply
+        if depth <= 0 and (not moves[0][1] or depth <= -QUIESCENCE_LIMIT):
+            return self.evaluation(position, player)
+
+        best_score, best = -WIN - 1, None
+        for move in self._order(moves, entry, position, player):
+            child = position.apply(move, player)
+            score = -self._negamax(child, player.opponent, position.next_key(key, move, player),
+                                   depth - 1, -beta, -alpha, ply + 1)
+            if score > best_score:
+                best_score, best = score, move
+                if score > alpha:
+                    alpha = score
+                    if alpha >= beta:
+                        cutoff = move[0][0], move[0][-1]
+                        self.history[cutoff] = self.history.get(cutoff, 0) + max(depth, 1) ** 2
+                        break
+
+        if best_score <= alpha_orig:
+            bound = UPPER
+        elif best_score >= beta:
+            bound = LOWER
+        else:
+            bound = EXACT
+        self.table.store(key, max(depth, 0), _to_table(best_score, ply), bound, pack(best))
+
+        return best_score
+
+    def _order(self, moves, entry, position, player):
+        """Move from the table first, then promotions, men reaching the last row, then moves by history of cut-offs."""
+        if len(moves) == 1:
+            return moves
+
+        history = self.history
+        men, last_row = position.men(player), PROMOTION_ROW[player]
+
+        def priority(move):
+            path = move[0]
+            promotion = men >> path[0] & 1 and 1 << path[-1] & last_row
+            return bool(promotion), history.get((path[0], path[-1]), 0)
+
+        ordered = sorted(moves, key=priority, reverse=True)
+
+        if entry is not None:
+            for i, move in enumerate(ordered):
+                if pack(move) == entry[4]:
+                    ordered.insert(0, ordered.pop(i))
+                    break
+        return ordered
+
+    @staticmethod
+    def _to_game_move(game, path):
+        # raises EndGameEvent when there is no move
+        all_moves = game.get_possible_moves()
+
+        squares = [square_addr(s) for s in path[0]]
+        for piece, moves in all_moves.items():
+            if piece.addr != squares[0]:
+                continue
+            for move in moves:
+                step, dests = move, []
+                while step is not None:
+                    dests.append(step.dest)
+                    step = step.following_move
+                if dests == squares[1:]:
+                    return move
+        return None
+
+
+def _from_tablebase(result, distance, ply):
+    if result == TABLE_WIN:
+        return WIN - ply - distance
+    if result == TABLE_LOSS:
+        return -WIN + ply + distance
+    return 0
+
+
+def _to_table(score, ply):
+    # scores of won or lost positions are stored relative to the position, not to the root
+    if score >= WIN - 1000:
+        return score + ply
+    if score <= -WIN + 1000:
+        return score - ply
+    return score
+
+
+def _from_table(score, ply):
+    if score >= WIN - 1000:
+        return score - ply
+    if score <= -WIN + 1000:
+        return score + ply
+    return score
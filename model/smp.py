@@ -0,0 +1,150 @@
+"""
+Lazy SMP: parallel alpha-beta search of worker processes sharing one transposition table.
+
+SharedTranspositionTable keeps its entries in multiprocessing.shared_memory, viewed as a NumPy
+structured array. Entries are read and written without locks: an entry is three 64-bit words,
+data (score, depth, bound and generation), packed move and key xor data xor move. A reader
+accepts an entry only when the words xor to its key, so an entry torn by writes of two processes
+at once is seen as missing, never as an entry of another position.
+
+Every worker runs its own iterative deepening of the same position, half of them one ply deeper,
+and they speed each other up through the shared table. The first worker to finish stops the others
+through a flag in the shared memory, the result of the deepest completed search is used.
+"""
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from model.search import Searcher, TranspositionTable
+
+ENTRY = np.dtype([('check', '<u8'), ('data', '<u8'), ('move', '<u8')])
+
+_SCORE_BIAS = 1 << 31
+_SCORE_MASK = (1 << 32) - 1
+_MOVE_LIMIT = 1 << 64
+
+
+class SharedTranspositionTable(TranspositionTable):
+    """
+    TranspositionTable in shared memory, entries are the same (key, depth, score, bound, packed move, generation)
+    tuples. Moves which do not fit into 64 bits are stored as 0, no move.
+    Passed to a worker process it is attached there by name, the process creating it owns the memory.
+    """
+
+    def __init__(self, size_bits=18, name=None):
+        """:param name: of the shared memory of an existing table to attach to, a new one is created when None."""
+        self.size_bits = size_bits
+        self.mask = (1 << size_bits) - 1
+        self.generation = 0
+        self.owner = name is None
+        # entries and one more word, the stop flag
+        size = (ENTRY.itemsize << size_bits) + 8
+        self.memory = shared_memory.SharedMemory(name=name, create=self.owner, size=size)
+        self.entries = np.ndarray(1 << size_bits, dtype=ENTRY, buffer=self.memory.buf)
+        # plain ints from a memoryview are much faster than NumPy scalars in the search
+        self.words = self.memory.buf.cast('Q')
+        self.flag = 3 << size_bits
+        if self.owner:
+            self.entries[:] = 0
+            self.words[self.flag] = 0
+
+    @property
+    def name(self):
+        return self.memory.name
+
+    def __reduce__(self):
+        return _attach, (self.name, self.size_bits)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def close(self):
+        if self.memory is None:
+            return
+        self.words.release()
+        self.words = self.entries = None
+        self.memory.close()
+        if self.owner:
+            self.memory.unlink()
+        self.memory = None
+
+    def used(self):
+        """Fraction of used slots."""
+        return np.count_nonzero(self.entries['data']) / len(self.entries)
+
+    def probe(self, key):
+        i = (key & self.mask) * 3
+        words = self.words
+        check, data, move = words[i], words[i + 1], words[i + 2]
+        if check ^ data ^ move != key:
+            return None
+        return key, (data >> 32) & 0xFF, (data & _SCORE_MASK) - _SCORE_BIAS, (data >> 40) & 0xFF, move, data >> 48
+
+    def store(self, key, depth, score, bound, move):
+        i = (key & self.mask) * 3
+        words = self.words
+        check, data, move_word = words[i], words[i + 1], words[i + 2]
+        if check ^ data ^ move_word != key and data >> 48 == self.generation and depth < (data >> 32) & 0xFF:
+            return
+
+        data = (score + _SCORE_BIAS) | min(depth, 0xFF) << 32 | bound << 40 | self.generation << 48
+        move = move if move < _MOVE_LIMIT else 0
+        words[i + 1] = data
+        words[i + 2] = move
+        words[i] = key ^ data ^ move
+
+    def new_search(self):
+        self.generation = (self.generation + 1) & 0xFFFF
+
+    def stopped(self):
+        return self.words[self.flag] != 0
+
+    def stop(self, stopped=True):
+        self.words[self.flag] = int(stopped)
+
+
+_tables = {}
+_searchers = {}
+
+
+def _attach(name, size_bits):
+    # a worker process attaches to every table once and keeps it
+    table = _tables.get(name)
+    if table is None:
+        table = _tables[name] = SharedTranspositionTable(size_bits, name)
+    return table
+
+
+def worker_search(table, position, player, square=None, depth=None, time_limit=None):
+    """
+    Search of a worker process, its Searcher is kept between searches with the same table.
+    :return: SearchResult, its move is None.
+    """
+    searcher = _searchers.get(table.name)
+    if searcher is None:
+        searcher = _searchers[table.name] = Searcher(table)
+    result = searcher.search_position(position, player, square, depth, time_limit)
+    table.stop()
+    return result
+
+
+def lazy_smp(executor, workers, table, position, player, square=None, depth=None, time_limit=None):
+    """
+    :param executor: concurrent.futures executor of worker processes.
+    :param table: SharedTranspositionTable.
+    :return: SearchResult of the deepest completed search, nodes of all workers together.
+    """
+    table.stop(False)
+    futures = []
+    for i in range(workers):
+        worker_depth = depth + i % 2 if depth is not None else None
+        futures.append(executor.submit(worker_search, table, position, player, square, worker_depth, time_limit))
+
+    results = [future.result() for future in futures]
+    best = max(results, key=lambda r: r.depth)
+    best.nodes = sum(r.nodes for r in results)
+    best.elapsed = max(r.elapsed for r in results)
+    return best
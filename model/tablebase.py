@@ -0,0 +1,257 @@
+"""
+Endgame tablebase: win/loss/draw and distance to the end of the game of every position with few pieces.
+
+Positions are grouped by material, (white men, white kings, red men, red kings) counts. Within a group
+a position has a perfect index: each kind of pieces is a combination of squares ranked in the
+combinatorial number system (men never stand on their last row), the ranks and the side to move
+are combined into one number. Indices of pieces standing on the same square are left unused.
+
+Every group is one file: a header, results packed by 2 bits (0 draw, 1 win, 2 loss of the player to move)
+and distances in plies to the end of the game, one byte each. Files are read through mmap, there is no load step.
+
+Groups are solved by retrograde analysis, from fewer pieces to more and from fewer men to more, so
+every capture or promotion leads to an already solved group. Tables are built for the 8x8 board only.
+"""
+import itertools as it
+import mmap
+import os
+import struct
+from collections import defaultdict
+from math import comb
+
+import numpy as np
+
+from model.bitboard import BitBoard, PROMOTION_ROW, squares, count
+from model.items import Player, EndGameEvent
+from model.rays import SQUARES
+
+DRAW, WIN, LOSS = range(3)
+
+MAGIC = b'CKTB'
+_HEADER = struct.Struct('<4sBBBBBI')
+_VERSION = 1
+MAX_DISTANCE = 255
+
+# squares allowed for white men, white kings, red men, red kings
+_ALLOWED = (tuple(s for s in range(SQUARES) if not PROMOTION_ROW[Player.white] >> s & 1),
+            tuple(range(SQUARES)),
+            tuple(s for s in range(SQUARES) if not PROMOTION_ROW[Player.red] >> s & 1),
+            tuple(range(SQUARES)))
+_OFFSETS = tuple(allowed[0] for allowed in _ALLOWED)
+
+
+def material(position):
+    """(white men, white kings, red men, red kings) counts of a BitBoard."""
+    return (count(position.white_men), count(position.white_kings),
+            count(position.red_men), count(position.red_kings))
+
+
+def table_size(signature):
+    size = 2
+    for allowed, n in zip(_ALLOWED, signature):
+        size *= comb(len(allowed), n)
+    return size
+
+
+def index(position, player):
+    """Index of position with player to move, within the table of its material."""
+    # white men, white kings, red men, red kings - the order of material() and BitBoard.masks()
+    masks = (position.white_men, position.white_kings, position.red_men, position.red_kings)
+    result = 0
+    for allowed, offset, mask in zip(_ALLOWED, _OFFSETS, masks):
+        rank = 0
+        for i, square in enumerate(squares(mask)):
+            rank += comb(square - offset, i + 1)
+        result = result * comb(len(allowed), count(mask)) + rank
+    return result * 2 + (player == Player.red)
+
+
+def signatures(max_pieces):
+    """Materials with both players on board, in the order they have to be solved."""
+    result = []
+    for total in range(2, max_pieces + 1):
+        for wm, wk, rm, rk in it.product(range(total + 1), repeat=4):
+            if wm + wk + rm + rk == total and wm + wk and rm + rk:
+                result.append((wm, wk, rm, rk))
+    # promotions turn men into kings, so groups with fewer men come first
+    return sorted(result, key=lambda s: (sum(s), s[0] + s[2]))
+
+
+def file_name(signature):
+    return "tb_{}{}{}{}.bin".format(*signature)
+
+
+class Tablebase:
+    """Read only access to the tables of a directory."""
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.tables = {}
+        self.max_pieces = 0
+
+        for name in os.listdir(directory):
+            if name.startswith('tb_') and name.endswith('.bin'):
+                self.max_pieces = max(self.max_pieces, sum(int(c) for c in name[3:-4]))
+
+    def close(self):
+        for f, mm in self.tables.values():
+            mm.close()
+            f.close()
+        self.tables.clear()
+
+    def probe(self, position, player):
+        """
+        :return: (result, distance) of the player to move, None when the position is not in the tables.
+        """
+        signature = material(position)
+        pieces = sum(signature)
+        if pieces > self.max_pieces:
+            return None
+        if not signature[0] + signature[1] or not signature[2] + signature[3]:
+            return _terminal(signature, player)
+
+        mm = self._open(signature)
+        if mm is None:
+            return None
+
+        i = index(position, player)
+        size = _HEADER.size + (table_size(signature) + 3) // 4
+        result = mm[_HEADER.size + (i >> 2)] >> ((i & 3) * 2) & 3
+        return result, mm[size + i]
+
+    def _open(self, signature):
+        if signature not in self.tables:
+            path = os.path.join(self.directory, file_name(signature))
+            if not os.path.exists(path):
+                return None
+            f = open(path, 'rb')
+            self.tables[signature] = f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        return self.tables[signature][1]
+
+
+def adjudicate(tablebase, board, player):
+    """Raises EndGameEvent when the result of the Board is known from the tables, winner is None for a draw."""
+    probe = tablebase.probe(BitBoard.from_board(board), player)
+    if probe is None:
+        return
+
+    result, _ = probe
+    if result == WIN:
+        raise EndGameEvent(player)
+    elif result == LOSS:
+        raise EndGameEvent(player.opponent)
+    raise EndGameEvent(None)
+
+
+def build(directory, max_pieces=3, progress=print):
+    """Solve and write every table with up to max_pieces pieces."""
+    os.makedirs(directory, exist_ok=True)
+    solved = {}
+
+    for signature in signatures(max_pieces):
+        results, distances = _solve(signature, solved)
+        solved[signature] = results, distances
+        _write(os.path.join(directory, file_name(signature)), signature, results, distances)
+
+        if progress:
+            wins, losses = np.count_nonzero(results == WIN), np.count_nonzero(results == LOSS)
+            progress(f"{file_name(signature)}: {len(results)} positions, {wins} wins, {losses} losses")
+
+
+def _terminal(signature, player):
+    # the player without pieces has lost, the other one can never be to move
+    has_pieces = signature[0] + signature[1] if player == Player.white else signature[2] + signature[3]
+    return (WIN, 1) if has_pieces else (LOSS, 0)
+
+
+def _positions(signature):
+    """Yields every valid BitBoard of the material."""
+    def place(kind, occupied, masks):
+        if kind == 4:
+            yield BitBoard(masks[0], masks[2], masks[1], masks[3])
+            return
+        for chosen in it.combinations(_ALLOWED[kind], signature[kind]):
+            mask = sum(1 << s for s in chosen)
+            if not mask & occupied:
+                yield from place(kind + 1, occupied | mask, masks + (mask,))
+
+    return place(0, 0, ())
+
+
+def _solve(signature, solved):
+    size = table_size(signature)
+    results = np.zeros(size, dtype=np.int8)
+    distances = np.zeros(size, dtype=np.int16)
+    remaining = np.zeros(size, dtype=np.int32)
+    longest = np.zeros(size, dtype=np.int16)
+    predecessors = defaultdict(list)
+    buckets = defaultdict(list)
+
+    def lost_successor(i, distance):
+        remaining[i] -= 1
+        longest[i] = max(longest[i], distance)
+        if not remaining[i]:
+            buckets[longest[i] + 1].append((i, LOSS))
+
+    for position in _positions(signature):
+        for player in Player:
+            i = index(position, player)
+            moves = position.generate(player)
+            if not moves:
+                buckets[0].append((i, LOSS))
+                continue
+
+            remaining[i] = len(moves)
+            for move in moves:
+                child, opponent = position.apply(move, player), player.opponent
+                child_signature = material(child)
+
+                if child_signature == signature:
+                    predecessors[index(child, opponent)].append(i)
+                    continue
+
+                result, distance = _lookup(solved, child_signature, child, opponent)
+                if result == LOSS:
+                    buckets[distance + 1].append((i, WIN))
+                elif result == WIN:
+                    lost_successor(i, distance)
+
+    # positions are decided in order of their distances, so the first win found is the fastest one
+    # and a loss is decided by its longest defence
+    while buckets:
+        distance = min(buckets)
+        for i, result in buckets.pop(distance):
+            if results[i]:
+                continue
+            results[i], distances[i] = result, min(distance, MAX_DISTANCE)
+
+            for p in predecessors.pop(i, ()):
+                if results[p]:
+                    continue
+                if result == LOSS:
+                    buckets[distance + 1].append((p, WIN))
+                else:
+                    lost_successor(p, distance)
+
+    return results, distances
+
+
+def _lookup(solved, signature, position, player):
+    if not signature[0] + signature[1] or not signature[2] + signature[3]:
+        return _terminal(signature, player)
+
+    results, distances = solved[signature]
+    i = index(position, player)
+    return results[i], distances[i]
+
+
+def _write(path, signature, results, distances):
+    packed = np.zeros((len(results) + 3) // 4, dtype=np.uint8)
+    for shift in range(4):
+        part = results[shift::4].astype(np.uint8) << (2 * shift)
+        packed[:len(part)] |= part
+
+    with open(path, 'wb') as f:
+        f.write(_HEADER.pack(MAGIC, _VERSION, *signature, len(results)))
+        f.write(packed.tobytes())
+        f.write(distances.clip(0, MAX_DISTANCE).astype(np.uint8).tobytes())
@@ -0,0 +1,65 @@
+"""
+Zobrist keys of a position.
+
+Key of a position is xor of the keys of all pieces on their squares, SIDE when red is to move
+and CONTINUATION of the square of a piece which has to continue its capture.
+Keys are generated from a fixed seed, so they are the same in every process and every run.
+Boards of other sizes than 8x8 have their own keys, see keys().
+"""
+import random
+
+from model.rays import SQUARES
+
+# kinds of pieces, the same order as masks of model.bitboard.BitBoard
+WHITE_MAN, RED_MAN, WHITE_KING, RED_KING = range(4)
+
+_SEED = 0x5EED
+
+
+class Keys:
+    """Keys of pieces, the side and continuations of a board with the number of playable squares."""
+
+    def __init__(self, squares, seed):
+        rnd = random.Random(seed)
+        self.pieces = tuple(tuple(rnd.getrandbits(64) for _ in range(squares)) for _ in range(4))
+        self.side = rnd.getrandbits(64)
+        self.continuation = tuple(rnd.getrandbits(64) for _ in range(squares))
+
+    # keys are shared, copies of boards refer to the same ones
+    def __deepcopy__(self, memo):
+        return self
+
+    def masks_key(self, masks, red_to_move=False, continuation=None):
+        """
+        Key computed from scratch.
+        :param masks: white men, red men, white kings, red kings masks.
+        :param continuation: square of the piece to continue capture.
+        """
+        key = self.side if red_to_move else 0
+        for kind, mask in enumerate(masks):
+            keys = self.pieces[kind]
+            while mask:
+                low = mask & -mask
+                key ^= keys[low.bit_length() - 1]
+                mask ^= low
+
+        if continuation is not None:
+            key ^= self.continuation[continuation]
+        return key
+
+
+_keys = {SQUARES: Keys(SQUARES, _SEED)}
+
+
+def keys(squares=SQUARES):
+    """Keys of a board with the number of playable squares, built once."""
+    result = _keys.get(squares)
+    if result is None:
+        result = _keys[squares] = Keys(squares, _SEED + squares)
+    return result
+
+
+PIECES = _keys[SQUARES].pieces
+SIDE = _keys[SQUARES].side
+CONTINUATION = _keys[SQUARES].continuation
+masks_key = _keys[SQUARES].masks_key
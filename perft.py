@@ -0,0 +1,200 @@
+"""
+Perft: counts leaf nodes of the moves tree to the given depth, from the start position
+and from every BoardLayout scenario of test/test_board.py. One ply is a complete move.
+
+    python perft.py -d 5
+    python perft.py -d 5 --divide --scenario start
+    python perft.py -d 5 --save-baseline perft.json
+    python perft.py -d 5 --baseline perft.json --threshold 0.2
+"""
+import argparse
+import inspect
+import json
+import sys
+import time
+
+from model.bitboard import BitBoard, BitboardMovesGenerator
+from model.game import Game
+from model.generator import MovesGenerator
+from model.items import EndGameEvent, Player
+from model.rays import square_addr
+from test import test_board
+from test.board_gen import BoardLayout, TailoredBoard
+
+BACKENDS = {'objects': MovesGenerator, 'bitboard': BitboardMovesGenerator, 'native': None}
+
+
+def perft(game, depth):
+    if depth == 0:
+        return 1
+
+    try:
+        all_moves = game.get_possible_moves()
+    except EndGameEvent:
+        return 0
+
+    if depth == 1:
+        return sum(len(moves) for moves in all_moves.values())
+
+    nodes = 0
+    for moves in all_moves.values():
+        for move in moves:
+            nodes += _perft_child(game, move, depth)
+    return nodes
+
+
+def native_perft(position, player, depth):
+    if depth == 0:
+        return 1
+
+    moves = position.generate(player)
+    if depth == 1:
+        return len(moves)
+
+    opponent = player.opponent
+    return sum(native_perft(position.apply(move, player), opponent, depth - 1) for move in moves)
+
+
+def divide(game, depth):
+    """Perft of every root move: list of (move, nodes)."""
+    result = []
+    for moves in game.get_possible_moves().values():
+        for move in moves:
+            result.append((_move_repr(move), _perft_child(game, move, depth)))
+    return result
+
+
+def native_divide(position, player, depth):
+    return [(_path_repr(move), native_perft(position.apply(move, player), player.opponent, depth - 1))
+            for move in position.generate(player)]
+
+
+def scenarios():
+    """Start position and every function of test/test_board.py returning a BoardLayout."""
+    result = {'start': None}
+    for name, function in inspect.getmembers(test_board, inspect.isfunction):
+        if function.__module__ == test_board.__name__ and not inspect.signature(function).parameters:
+            layout = function()
+            if isinstance(layout, BoardLayout):
+                result[name] = function
+    return result
+
+
+def run(scenario, layout_function, depth, backend, show_divide=False):
+    game = Game(BACKENDS[backend] or MovesGenerator)
+    if layout_function is not None:
+        game.board = TailoredBoard(layout_function())
+
+    print(f"{scenario} ({backend})")
+    print(f"{'depth':>5} {'nodes':>12} {'time [s]':>10} {'nodes/s':>12}")
+
+    results = {}
+    for d in range(1, depth + 1):
+        start = time.perf_counter()
+        if backend == 'native':
+            nodes = native_perft(BitBoard.from_board(game.board), Player.white, d)
+        else:
+            nodes = perft(game, d)
+        elapsed = time.perf_counter() - start
+
+        nps = nodes / elapsed if elapsed else 0.0
+        results[str(d)] = {'nodes': nodes, 'time': elapsed, 'nps': nps}
+        print(f"{d:>5} {nodes:>12} {elapsed:>10.3f} {nps:>12.0f}")
+
+    if show_divide:
+        if backend == 'native':
+            divided = native_divide(BitBoard.from_board(game.board), Player.white, depth)
+        else:
+            divided = divide(game, depth)
+        for move, nodes in divided:
+            print(f"  {move}: {nodes}")
+    print()
+
+    return results
+
+
+def compare(results, baseline, threshold, backend):
+    """
+    :param baseline: saved with --save-baseline, {'backend': ..., 'results': ...}.
+    :param backend: of results. Throughput of different backends is not comparable, a baseline of another one
+        is a failure and only its node counts are checked.
+    :return: list of failures, node counts differing from baseline or throughput dropped by more than threshold.
+    """
+    failures = []
+    same_backend = baseline.get('backend') == backend
+    if not same_backend:
+        failures.append(f"baseline of the {baseline.get('backend')} backend, results of the {backend} backend")
+
+    for scenario, depths in results.items():
+        for depth, result in depths.items():
+            expected = baseline['results'].get(scenario, {}).get(depth)
+            if expected is None:
+                continue
+
+            if result['nodes'] != expected['nodes']:
+                failures.append(f"{scenario} depth {depth}: {result['nodes']} nodes, expected {expected['nodes']}")
+
+            # short runs are dominated by noise
+            if same_backend and expected['time'] >= 0.05 and result['nps'] < expected['nps'] * (1 - threshold):
+                failures.append(f"{scenario} depth {depth}: {result['nps']:.0f} nodes/s, "
+                                f"baseline {expected['nps']:.0f} nodes/s")
+    return failures
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Count leaf nodes of the moves tree.")
+    parser.add_argument('-d', '--depth', type=int, default=4)
+    parser.add_argument('-b', '--backend', choices=BACKENDS.keys(), default='objects')
+    parser.add_argument('-s', '--scenario', action='append', help="start or name of a test/test_board.py layout")
+    parser.add_argument('--divide', action='store_true', help="print nodes of every root move")
+    parser.add_argument('--save-baseline', metavar='FILE')
+    parser.add_argument('--baseline', metavar='FILE')
+    parser.add_argument('--threshold', type=float, default=0.2, help="allowed drop of nodes/s, 0.2 is 20%%")
+    args = parser.parse_args(argv)
+
+    available = scenarios()
+    selected = args.scenario or list(available)
+
+    results = {}
+    for scenario in selected:
+        results[scenario] = run(scenario, available[scenario], args.depth, args.backend, args.divide)
+
+    if args.save_baseline:
+        with open(args.save_baseline, 'w') as f:
+            json.dump({'backend': args.backend, 'results': results}, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+
+        failures = compare(results, baseline, args.threshold, args.backend)
+        for failure in failures:
+            print("FAIL", failure)
+        if failures:
+            return 1
+        print("OK, no regression against", args.baseline)
+    return 0
+
+
+def _perft_child(game, move, depth):
+    game.play(move)
+    nodes = perft(game, depth - 1)
+    for _ in range(len(move)):
+        game.undo()
+    return nodes
+
+
+def _move_repr(move):
+    path = [move.piece.addr]
+    while move is not None:
+        path.append(move.dest)
+        move = move.following_move
+    return " -> ".join(str(addr) for addr in path)
+
+
+def _path_repr(move):
+    return " -> ".join(str(square_addr(square)) for square in move[0])
+
+
+if __name__ == '__main__':
+    sys.exit(main())
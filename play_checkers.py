@@ -1,8 +1,32 @@
 """
 Rules: https://www.kurnik.pl/warcaby/zasady.phtml
+
+    python play_checkers.py
+    python play_checkers.py --engine red --clock 300 --increment 2
+    python play_checkers.py --international
 """
+import argparse
 
 import controller as c
+from model.engine import Engine, TimeManager
+from model.items import Player
 
 if __name__ == '__main__':
-    c.Controller().start_game()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Play checkers in the terminal.")
+    parser.add_argument('--engine', choices=[p.name for p in Player], help="player of the engine opponent")
+    parser.add_argument('--clock', type=float, default=300.0, help="seconds on the engine's clock")
+    parser.add_argument('--increment', type=float, default=0.0, help="seconds added after every move")
+    parser.add_argument('--no-ponder', action='store_true', help="do not think on the human player's time")
+    parser.add_argument('--international', action='store_true', help="10x10 board with 20 pieces a side")
+    args = parser.parse_args()
+
+    if args.international and args.engine:
+        parser.error("the engine plays only on the 8x8 board")
+
+    if args.engine:
+        engine = Engine(TimeManager(args.clock, args.increment), ponder=not args.no_ponder)
+        c.Controller(engine, Player[args.engine]).start_game()
+    elif args.international:
+        c.Controller(size=10, starting_rows=4).start_game()
+    else:
+        c.Controller().start_game()
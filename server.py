@@ -0,0 +1,298 @@
+"""
+Asyncio game server hosting many games at once, speaking JSON lines over TCP or a Unix socket.
+
+Every request is one JSON object on a line, every response is one line with the same "id":
+
+    {"id": 1, "op": "new", "opponent": "search:4", "computer": "red"}  -> {"id": 1, "ok": true, "session": ...}
+    {"id": 2, "op": "move", "session": "...", "move": "9-14"}
+    {"id": 3, "op": "state", "session": "..."}
+    {"id": 4, "op": "hint", "session": "...", "player": "search:0.5s"}
+    {"id": 5, "op": "close", "session": "..."}
+
+Moves are written as in model.pdn. A state holds the position in the FEN form of model.pdn,
+the player to move, legal moves and the winner once the game is over. Requests of a connection
+are handled concurrently, requests of a session one after another, sessions are closed together
+with the connection they were created through. Moves are generated in a single worker thread
+and computer players think in a process pool, the event loop only passes messages.
+
+    python server.py --port 8765
+    python server.py --unix /tmp/checkers.sock --workers 4
+"""
+import argparse
+import asyncio
+import json
+import sys
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from multiprocessing import util
+
+from model.bitboard import BitboardMovesGenerator
+from model.cache import MovesCache
+from model.game import Game
+from model.items import Board, Player, EndGameEvent
+from model.pdn import PDNError, PDN_SIDES, find_move, format_move
+from model.players import create_player, parse_player
+from model.records import to_fen
+
+MAX_SESSIONS = 10000
+MAX_PLAYERS = 8
+
+
+class ProtocolError(Exception):
+    pass
+
+
+class Session:
+    def __init__(self, opponent=None, colour=Player.red, cache=None):
+        """
+        :param opponent: create_player() specification of the computer player, None for two human players.
+        :param colour: Player the computer plays.
+        """
+        self.id = uuid.uuid4().hex
+        self.game = Game(BitboardMovesGenerator, cache=cache)
+        self.opponent = opponent
+        self.colour = colour
+        self.lock = asyncio.Lock()
+        self.finished = False
+        self.winner = None
+
+    def moves(self):
+        """Legal moves as text, the game is finished when there is none."""
+        try:
+            all_moves = self.game.get_possible_moves()
+        except EndGameEvent as e:
+            self.finished, self.winner = True, e.args[0]
+            return []
+        return [format_move(move) for moves in all_moves.values() for move in moves]
+
+    def play(self, token):
+        self.game.play(find_move(self.game, token))
+
+    def play_path(self, path):
+        """:param path: (path, captured) tuple of model.bitboard."""
+        for moves in self.game.get_possible_moves().values():
+            for move in moves:
+                if move.path == path:
+                    # Move.path follows the piece, it is formatted from path once the move is made
+                    self.game.play(move)
+                    return format_move(path)
+        raise ProtocolError(f"Illegal move {format_move(path)}")
+
+    def state(self):
+        moves = self.moves()
+        return {'session': self.id, 'position': to_fen(self.game.board, self.game.current_player, PDN_SIDES),
+                'player': self.game.current_player.name, 'moves': moves, 'finished': self.finished,
+                'winner': self.winner.name if self.winner else None, 'plies': len(self.game.moves())}
+
+    def position(self):
+        return tuple(self.game.board.masks), self.game.current_player == Player.red
+
+
+_players = OrderedDict()
+
+
+def _init_worker():
+    # players hold worker processes and shared memory of their own, released when the worker exits,
+    # before the finalizers of multiprocessing queues stop the threads feeding their workers
+    util.Finalize(None, _close_players, exitpriority=100)
+
+
+def _close_players():
+    while _players:
+        _players.popitem()[1].close()
+
+
+def think(spec, masks, red_to_move):
+    """
+    Move of a computer player in a worker process. The MAX_PLAYERS most recently used players are kept
+    between calls, the least recently used one is closed when another one is needed.
+    """
+    player = _players.get(spec)
+    if player is None:
+        if len(_players) >= MAX_PLAYERS:
+            _players.popitem(last=False)[1].close()
+        player = _players[spec] = create_player(spec)
+    _players.move_to_end(spec)
+
+    game = Game(BitboardMovesGenerator)
+    game.board = Board.from_masks(masks)
+    if red_to_move:
+        game.current_player = Player.red
+        game.board.toggle_side()
+    return player.choose(game).path
+
+
+def _check_player(spec):
+    """Checks a create_player() specification of a request, the player is created in a worker process."""
+    if not isinstance(spec, str):
+        raise ProtocolError(f"Unknown player {spec!r}")
+    parse_player(spec)
+
+
+class GameServer:
+    def __init__(self, workers=None, max_sessions=MAX_SESSIONS):
+        """:param workers: processes of computer players."""
+        self.sessions = {}
+        self.max_sessions = max_sessions
+        self.cache = MovesCache()
+        self.games_executor = ThreadPoolExecutor(max_workers=1)
+        self.players_executor = ProcessPoolExecutor(max_workers=workers, initializer=_init_worker)
+
+    def close(self):
+        self.games_executor.shutdown()
+        self.players_executor.shutdown()
+
+    async def handle_connection(self, reader, writer):
+        """Serves requests of a connection, sessions created through it are closed with it."""
+        tasks = set()
+        owned = set()
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                if line.strip():
+                    task = asyncio.ensure_future(self._respond(line, writer, owned))
+                    tasks.add(task)
+                    task.add_done_callback(tasks.discard)
+            if tasks:
+                await asyncio.wait(tasks)
+        finally:
+            for session_id in owned:
+                self.sessions.pop(session_id, None)
+            writer.close()
+
+    async def _respond(self, line, writer, owned=None):
+        request_id = None
+        try:
+            request = json.loads(line)
+            if not isinstance(request, dict):
+                raise ProtocolError("Request is not an object")
+            request_id = request.get('id')
+            response = await self.handle(request, owned)
+            response['ok'] = True
+        except (ProtocolError, PDNError, ValueError) as e:
+            response = {'ok': False, 'error': str(e)}
+        except Exception as e:
+            response = {'ok': False, 'error': f"Internal error: {e!r}"}
+
+        response['id'] = request_id
+        writer.write(json.dumps(response).encode() + b"\n")
+        await writer.drain()
+
+    async def handle(self, request, owned=None):
+        """
+        :param owned: ids of sessions of the connection, a new session is added to it.
+        :return: response dict of a request dict.
+        """
+        op = request.get('op')
+        if op == 'new':
+            return await self._new(request, owned)
+
+        session = self.sessions.get(request.get('session'))
+        if session is None:
+            raise ProtocolError(f"Unknown session {request.get('session')!r}")
+
+        async with session.lock:
+            if op == 'state':
+                return await self._run(session.state)
+            elif op == 'move':
+                return await self._move(session, request)
+            elif op == 'hint':
+                if session.finished:
+                    raise ProtocolError("The game is over")
+                spec = request.get('player', session.opponent or 'search:4')
+                _check_player(spec)
+                move = await self._think(session, spec)
+                return {'move': format_move(move)}
+            elif op == 'close':
+                del self.sessions[session.id]
+                return {'session': session.id}
+        raise ProtocolError(f"Unknown op {op!r}")
+
+    async def _new(self, request, owned=None):
+        if len(self.sessions) >= self.max_sessions:
+            raise ProtocolError("Too many sessions")
+
+        colour = request.get('computer', 'red')
+        if colour not in Player.__members__:
+            raise ProtocolError(f"Unknown player {colour!r}")
+        opponent = request.get('opponent')
+        if opponent is not None:
+            _check_player(opponent)
+
+        session = Session(opponent, Player[colour], self.cache)
+        self.sessions[session.id] = session
+        if owned is not None:
+            owned.add(session.id)
+        async with session.lock:
+            response = {}
+            if opponent is not None and session.colour == Player.white:
+                response['reply'] = await self._reply(session)
+            response.update(await self._run(session.state))
+        return response
+
+    async def _move(self, session, request):
+        if session.opponent is not None and session.game.current_player == session.colour:
+            raise ProtocolError("Not your move")
+        if session.finished:
+            raise ProtocolError("The game is over")
+
+        await self._run(session.play, str(request.get('move', '')))
+
+        response = {}
+        if session.opponent is not None:
+            response['reply'] = await self._reply(session)
+        response.update(await self._run(session.state))
+        return response
+
+    async def _reply(self, session):
+        """The computer's moves until the human player is to move again."""
+        replies = []
+        while session.game.current_player == session.colour and await self._run(session.moves):
+            move = await self._think(session, session.opponent)
+            replies.append(await self._run(session.play_path, move))
+        return replies
+
+    async def _think(self, session, spec):
+        masks, red_to_move = session.position()
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.players_executor, think, spec, masks, red_to_move)
+
+    async def _run(self, function, *args):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.games_executor, function, *args)
+
+
+async def serve(server, host='127.0.0.1', port=8765, unix=None):
+    if unix:
+        listener = await asyncio.start_unix_server(server.handle_connection, unix)
+    else:
+        listener = await asyncio.start_server(server.handle_connection, host, port)
+
+    async with listener:
+        await listener.serve_forever()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Serve games over JSON lines.")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--unix', help="Unix socket path, instead of TCP")
+    parser.add_argument('-w', '--workers', type=int, default=None, help="processes of computer players")
+    parser.add_argument('--max-sessions', type=int, default=MAX_SESSIONS)
+    args = parser.parse_args(argv)
+
+    server = GameServer(args.workers, args.max_sessions)
+    try:
+        asyncio.run(serve(server, args.host, args.port, args.unix))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.close()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
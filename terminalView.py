@@ -47,7 +47,7 @@ King.to_str = _king_to_str
 def print_board(board, fields_with_id):
     """
     Print board. Showing available choices.
-    :param board: numpy board, 8 x 8
+    :param board: numpy board, 8 x 8 or 10 x 10
     :param fields_with_id: dictionary, key: addr, value: id.
                            Can be either EmptyField or Piece/King
     :return: None.
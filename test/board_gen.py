@@ -1,9 +1,8 @@
 import itertools as it
 
-import numpy as np
-
 from controller import Controller
-from model.items import BoardMember, Player, King, Piece, Board
+from model.items import Player, King, Piece, Board
+from model.rays import geometry
 
 
 class BoardLayout:
@@ -18,6 +17,7 @@ class BoardLayout:
      f70;    ; f72;    ; f74;    ; f76;
 
     Creates pieces to be injected into Tailored Board.
+    :param size: of the board, fields of the 10x10 board go up to f98.
     Possible kwargs:
         - keys: see table above,
         - vals: 'wP' := White Piece
@@ -26,7 +26,8 @@ class BoardLayout:
                 'rK' := Red King
     """
 
-    def __init__(self, **kwargs):
+    def __init__(self, size=8, **kwargs):
+        self.size = size
         self.pieces = {}
 
         to_set_up = self._filter_kwargs(**kwargs)
@@ -35,7 +36,7 @@ class BoardLayout:
             row, col = int(row), int(col)
             player, piece_class = self._translate_piece_config(piece_config)
 
-            self.pieces[(row, col)] = piece_class(row, col, player)
+            self.pieces[(row, col)] = piece_class(row, col, player, geometry=geometry(size))
 
     def __call__(self):
         """
@@ -45,7 +46,7 @@ class BoardLayout:
         return self.pieces
 
     def _filter_kwargs(self, **kw):
-        available_keys = ['f' + str(row) + str(col) for row, col in it.product(range(8), range(8))
+        available_keys = ['f' + str(row) + str(col) for row, col in it.product(range(self.size), range(self.size))
                           if not (row + col + 1) % 2]
         available_vals = [color + piece_type for color, piece_type in it.product(['W', 'R'], ['P', 'K'])]
 
@@ -62,13 +63,15 @@ class BoardLayout:
 
 class TailoredBoard(Board):
     def __init__(self, board_layout):
-        self.board = np.empty((8, 8), dtype=BoardMember)
+        self._init_geometry(board_layout.size)
         self._init_fields()
 
         pieces_dict = board_layout()
         for addr, piece in pieces_dict.items():
             self.board[addr] = piece
 
+        self._init_state()
+
 
 def start_test_scenario(board_layout):
     c = Controller()
@@ -1,8 +1,760 @@
+import io
+import os
+import random
+import tempfile
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
 from unittest import TestCase
 
+import numpy as np
+
+from model.batch import BatchBoard, play_out
+from model.book import OpeningBook, build as build_book
+from model.cache import MovesCache
+from model.engine import Engine, TimeManager
+from model.evaluation import Weights, evaluate, evaluate_positions
+from model.bitboard import BitBoard, BitboardMovesGenerator, pack, unpack, to_move
+from model.game import Game
+from model.generator import MovesGenerator
+from model.instrumentation import measure
+from model.items import Board, EmptyField, EndGameEvent, King, Move, Piece, Player, empty_field
+from model.mcts import MCTS, parallel_search
+from model.pdn import PDNError, read_games, write_games
+from model.players import create_player
+from model.rays import square_index
+from model.records import GameStore, to_bytes, from_bytes, to_fen, from_fen, POSITION
+from model.search import Searcher, MAN_VALUE, WIN, LOWER
+from model.smp import SharedTranspositionTable, lazy_smp
+from model.tablebase import Tablebase, build, signatures, DRAW, WIN as TABLE_WIN, LOSS as TABLE_LOSS
+from model.tablebase import _positions
+from perft import compare as perft_compare
+from test.board_gen import TailoredBoard, BoardLayout
+from tournament import play_game
+from test.test_board import multimoves_calculation, upgrade_test, end_game, sort_moves
+
+
+def _flatten(all_moves):
+    result = []
+    for piece, moves in all_moves.items():
+        for move in moves:
+            steps = []
+            while move is not None:
+                captured = move.captured_piece.addr if move.is_capturing else None
+                steps.append((move.dest, captured))
+                move = move.following_move
+            result.append((piece.addr, steps))
+    return result
+
+
+def _generate(generator_cls, game):
+    try:
+        return _flatten(generator_cls(game.current_player, game.board, game.piece_to_continue).generate())
+    except EndGameEvent as e:
+        return e.args
+
+
+def _scan_pieces(board):
+    items = [item for row in board() for item in row]
+    return [[item for item in items if getattr(item, 'player', None) == player] for player in Player]
+
 
 class TestMovesGenerator(TestCase):
     def test_if_no_moves_available_return_empty_list(self):
         self.fail()
 
     # todo!!: wymyslic testy...
+
+
+class TestBitboardMovesGenerator(TestCase):
+    def test_layouts_match_moves_generator(self):
+        game = Game()
+        for layout in [multimoves_calculation, upgrade_test, end_game, sort_moves]:
+            for player in Player:
+                game.board = TailoredBoard(layout())
+                game.current_player = player
+                self.assertEqual(_generate(MovesGenerator, game), _generate(BitboardMovesGenerator, game))
+
+    def test_random_game_matches_moves_generator(self):
+        rnd = random.Random(7)
+        game = Game()
+        with game:
+            for _ in range(200):
+                expected = _generate(MovesGenerator, game)
+                self.assertEqual(expected, _generate(BitboardMovesGenerator, game))
+
+                all_moves = game.get_possible_moves()
+                game.move(rnd.choice([m for moves in all_moves.values() for m in moves]))
+
+    def test_move_path_and_packing(self):
+        game = Game()
+        game.board = TailoredBoard(multimoves_calculation())
+        position = BitBoard.from_board(game.board)
+
+        paths = [m.path for moves in game.get_possible_moves().values() for m in moves]
+
+        self.assertEqual(position.generate(Player.white), paths)
+        for path in paths:
+            self.assertEqual(path[0], unpack(pack(path)))
+
+    def test_three_captures_in_a_row(self):
+        position = BitBoard(white_men=1 << square_index(0, 1),
+                            red_men=1 << square_index(1, 2) | 1 << square_index(3, 2) | 1 << square_index(5, 2))
+
+        moves = position.generate(Player.white)
+
+        self.assertEqual(1, len(moves))
+        self.assertEqual(3, len(moves[0][1]))
+
+    def test_initial_position(self):
+        game = Game()
+        self.assertEqual(BitBoard.initial(), BitBoard.from_board(game.board))
+        self.assertEqual(7, len(BitBoard.initial().generate(Player.white)))
+
+
+class TestBoard(TestCase):
+    def test_undo_restores_position(self):
+        rnd = random.Random(3)
+        game = Game()
+        initial = repr(game.board)
+        positions = []
+
+        with game:
+            for _ in range(120):
+                all_moves = game.get_possible_moves()
+                positions.append((repr(game.board), game.current_player, game.piece_to_continue))
+                game.move(rnd.choice([m for moves in all_moves.values() for m in moves]))
+
+        while game.history:
+            game.undo()
+            self.assertEqual(positions.pop(), (repr(game.board), game.current_player, game.piece_to_continue))
+
+        self.assertEqual(initial, repr(game.board))
+
+    def test_key_is_updated_incrementally(self):
+        rnd = random.Random(5)
+        game = Game()
+        keys = []
+
+        with game:
+            for _ in range(120):
+                all_moves = game.get_possible_moves()
+                expected = game.board.compute_key(game.current_player, game.piece_to_continue)
+                self.assertEqual(expected, game.board.key)
+                self.assertEqual(_scan_pieces(game.board), [game.board.get_pieces(p) for p in Player])
+                keys.append(game.board.key)
+                game.move(rnd.choice([m for moves in all_moves.values() for m in moves]))
+
+        while game.history:
+            game.undo()
+            self.assertEqual(keys.pop(), game.board.key)
+
+    def test_empty_fields_are_shared(self):
+        rnd = random.Random(7)
+        game = Game()
+        with game:
+            for _ in range(40):
+                game.move(rnd.choice([m for moves in game.get_possible_moves().values() for m in moves]))
+
+        clone = game.board.clone()
+        for board in (game.board, clone):
+            for (row, col), field in np.ndenumerate(board()):
+                if isinstance(field, EmptyField):
+                    self.assertIs(empty_field(row, col), field)
+        self.assertEqual(repr(game.board), repr(clone))
+        for original, copied in zip(game.board.get_pieces(Player.white), clone.get_pieces(Player.white)):
+            self.assertIsNot(original, copied)
+        with self.assertRaises(AttributeError):
+            empty_field(0, 1).row = 2
+
+    def test_international_board(self):
+        game = Game(size=10, starting_rows=4)
+        self.assertEqual([20, 20], [game.board.count(p) for p in Player])
+        # perft of international draughts
+        self.assertEqual([9, 81, 658], [_perft(game, depth) for depth in (1, 2, 3)])
+        position = BitBoard.from_board(game.board)
+        self.assertEqual(BitBoard.of_size(10).initial(), position)
+        self.assertEqual([9, 81, 658, 4265], [_native_perft(position, Player.white, depth) for depth in (1, 2, 3, 4)])
+        self.assertEqual(game.board.key, position.key(Player.white))
+        self.assertRaises(ValueError, Searcher().search, game)
+        self.assertRaises(ValueError, create_player, 'greedy', size=10)
+        self.assertIsInstance(create_player('random', size=10).choose(game), Move)
+
+        # a man is crowned on the last row, then a flying king captures two pieces and lands anywhere behind
+        game.board = TailoredBoard(BoardLayout(size=10, f81='wP', f05='rK', f23='wP', f54='wP'))
+        game.board.key = game.board.compute_key(game.current_player)
+        game.play(game.get_possible_moves()[game.board()[8, 1]][0])
+        self.assertIsInstance(game.board()[9, 0], King)
+        self.assertTrue(game.is_capture_forced())
+        self.assertEqual([((2, 16, dest), (11, 27)) for dest in (32, 38, 43, 49)],
+                         [move.path for move in game.iter_moves()])
+        self.assertEqual(game.board.compute_key(game.current_player), game.board.key)
+
+    def test_international_board_with_cache(self):
+        cache = MovesCache()
+        rnd = random.Random(11)
+        game, cached = Game(size=10, starting_rows=4), Game(size=10, starting_rows=4, cache=cache)
+
+        with game, cached:
+            for _ in range(60):
+                expected = game.get_possible_moves()
+                for _ in range(2):
+                    all_moves = cached.get_possible_moves()
+                    self.assertEqual([(p.addr, sorted(m.path for m in moves)) for p, moves in expected.items()],
+                                     [(p.addr, sorted(m.path for m in moves)) for p, moves in all_moves.items()])
+                self.assertTrue(all(isinstance(piece, Piece) for piece in all_moves))
+
+                move = rnd.choice([m for moves in expected.values() for m in moves])
+                cached.move(next(m for moves in all_moves.values() for m in moves if m.path == move.path))
+                game.move(move)
+        self.assertGreater(cache.hits, 0)
+
+
+class TestGamePredicates(TestCase):
+    def test_predicates_agree_with_generated_moves(self):
+        rnd = random.Random(21)
+        game = Game()
+
+        with game:
+            for _ in range(150):
+                all_moves = game.get_possible_moves()
+                flat = [move for moves in all_moves.values() for move in moves]
+
+                self.assertTrue(game.has_legal_move())
+                self.assertEqual(flat[0].is_capturing, game.is_capture_forced())
+                self.assertEqual(sorted(m.path for m in flat), sorted(m.path for m in game.iter_moves()))
+
+                move = rnd.choice(flat)
+                dests = [step.dest for step in _steps(move)]
+                self.assertTrue(game.is_legal(move.piece.addr, dests))
+                self.assertFalse(game.is_legal(move.piece.addr, dests + [move.piece.addr]))
+                game.move(move)
+
+        self.assertEqual(game.has_legal_move(), game.winner is None)
+
+    def test_continuation_and_end_of_game(self):
+        game = Game()
+        game.board = TailoredBoard(BoardLayout(f12='wP', f23='rP', f43='rP'))
+        game.move(game.get_possible_moves()[game.board()[1, 2]][0])
+
+        self.assertTrue(game.is_capture_forced())
+        self.assertTrue(game.is_legal((3, 4), [(5, 2)]))
+        self.assertEqual(1, len(list(game.iter_moves())))
+
+        game.move(next(game.iter_moves()))
+        self.assertFalse(game.has_legal_move())
+
+    def test_captures_are_forced_and_longest(self):
+        game = Game()
+        game.board = TailoredBoard(BoardLayout(f23='wP', f21='wP', f34='rP', f70='rP'))
+        self.assertFalse(game.is_legal((2, 1), [(3, 2)]))
+        self.assertTrue(game.is_legal((2, 3), [(4, 5)]))
+
+        game.board = TailoredBoard(BoardLayout(f21='wP', f05='wP', f32='rP', f16='rP', f36='rP', f70='rP'))
+        self.assertFalse(game.is_legal((2, 1), [(4, 3)]))
+        self.assertTrue(game.is_legal((0, 5), [(2, 7), (4, 5)]))
+
+
+class TestEvaluation(TestCase):
+    def test_batch_agrees_with_scalar(self):
+        rnd = random.Random(5)
+        positions = []
+        for _ in range(10):
+            position, player = BitBoard.initial(), Player.white
+            for _ in range(60):
+                positions.append((position, player))
+                moves = position.generate(player)
+                if not moves:
+                    break
+                position, player = position.apply(rnd.choice(moves), player), player.opponent
+
+        weights = Weights(man=7, king=11, advancement=2, back_rank=3, center=5, mobility=13)
+        for w in (Weights.load(), weights):
+            self.assertEqual([evaluate(p, player, w) for p, player in positions], evaluate_positions(positions, w))
+
+    def test_weights_from_file(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'weights.json')
+            Weights(man=1, mobility=1).save(path)
+            weights = Weights.load(path)
+
+        # one man more, 5 quiet moves of white against 2 of red
+        position = BitBoard(white_men=1 << square_index(2, 1) | 1 << square_index(2, 5) | 1 << square_index(0, 7),
+                            red_men=1 << square_index(7, 0) | 1 << square_index(6, 1))
+        self.assertEqual(1 + 5 - 2, evaluate(position, Player.white, weights))
+        self.assertEqual(-4, evaluate(position, Player.red, weights))
+        self.assertRaises(ValueError, Weights, tempo=1)
+
+    def test_greedy_player_beats_random(self):
+        wins = 0
+        for i in range(10):
+            white, red = ('greedy', 'random') if i % 2 == 0 else ('random', 'greedy')
+            record = play_game(i, white, red, seed=100 + 2 * i)
+            wins += record['winner'] == ('white' if i % 2 == 0 else 'red')
+        self.assertGreaterEqual(wins, 9)
+
+
+class TestSearcher(TestCase):
+    def test_returns_legal_move(self):
+        game = Game()
+        result = Searcher().search(game, depth=4)
+
+        all_moves = [(p.addr, m.dest) for p, moves in game.get_possible_moves().items() for m in moves]
+        self.assertIn((result.move.piece.addr, result.move.dest), all_moves)
+        self.assertEqual(4, result.depth)
+        self.assertGreater(result.nodes, 0)
+
+    def test_finds_winning_capture(self):
+        position = BitBoard(white_kings=1 << square_index(7, 0), white_men=1 << square_index(0, 1),
+                            red_men=1 << square_index(5, 2) | 1 << square_index(4, 7))
+
+        result = Searcher().search_position(position, Player.white, depth=4)
+
+        self.assertEqual((square_index(5, 2),), result.path[1])
+        self.assertGreater(result.score, MAN_VALUE)
+
+    def test_promotions_are_ordered_after_table_move(self):
+        man, promoting = square_index(2, 1), square_index(6, 1)
+        position = BitBoard(white_men=1 << man | 1 << promoting, red_kings=1 << square_index(0, 7))
+        moves = position.generate(Player.white)
+        quiet = next(move for move in moves if move[0][0] == man)
+        searcher = Searcher()
+        searcher.history[quiet[0]] = 100
+
+        ordered = searcher._order(moves, None, position, Player.white)
+        self.assertEqual([promoting, promoting, man, man], [move[0][0] for move in ordered])
+        self.assertEqual(quiet, ordered[2])
+
+        ordered = searcher._order(moves, (0, 1, 0, 0, pack(quiet), 0), position, Player.white)
+        self.assertEqual(quiet, ordered[0])
+        self.assertEqual([promoting, promoting], [move[0][0] for move in ordered[1:3]])
+
+
+class TestSharedTranspositionTable(TestCase):
+    def test_store_and_probe(self):
+        with SharedTranspositionTable(size_bits=4) as table:
+            key = 0xDEADBEEF12345678
+            table.store(key, 5, -WIN + 3, LOWER, 1234)
+            self.assertEqual((key, 5, -WIN + 3, LOWER, 1234, 0), table.probe(key))
+            self.assertIsNone(table.probe(key ^ 1 << 63))
+
+            attached = SharedTranspositionTable(4, table.name)
+            self.assertEqual(table.probe(key), attached.probe(key))
+            # an entry half written by another process is not found
+            attached.words[(key & 15) * 3 + 1] += 1
+            self.assertIsNone(table.probe(key))
+            attached.close()
+
+    def test_lazy_smp(self):
+        position = BitBoard.initial()
+        with SharedTranspositionTable() as table, ProcessPoolExecutor(max_workers=2) as executor:
+            result = lazy_smp(executor, 2, table, position, Player.white, depth=4)
+
+        self.assertIn(result.path, position.generate(Player.white))
+        self.assertGreaterEqual(result.depth, 4)
+        self.assertGreater(result.nodes, 0)
+
+
+class TestEngine(TestCase):
+    def test_time_manager(self):
+        clock = TimeManager(60, increment=1, moves_to_go=30)
+        self.assertEqual((3.0, 9.0), clock.allocate(BitBoard.initial(), Player.white))
+        # two captures to choose from
+        position = BitBoard(white_men=1 << square_index(2, 3),
+                            red_men=1 << square_index(3, 2) | 1 << square_index(3, 4))
+        self.assertEqual((4.5, 13.5), clock.allocate(position, Player.white))
+
+        stop = clock.stop_rule(3.0)
+        move = ((8, 12), ())
+        self.assertFalse(stop(1, move, 0, 0.1))
+        self.assertFalse(stop(2, move, 0, 0.8))
+        self.assertTrue(stop(3, move, 0, 0.8))
+        self.assertTrue(clock.stop_rule(3.0)(1, move, 0, 1.6))
+
+        clock.spend(10)
+        self.assertEqual(51, clock.remaining)
+
+    def test_keeps_pondering_when_prediction_hits(self):
+        engine = Engine(TimeManager(10), table_bits=16)
+        game = Game()
+        game.play(engine.choose(game))
+
+        engine.ponder(game)
+        self.assertIsNotNone(engine.prediction)
+        game.play(to_move(game.board, engine.prediction))
+        game.play(engine.choose(game))
+        self.assertEqual(1, engine.hits)
+
+        engine.ponder(game)
+        engine.stop()
+        self.assertIsNone(engine.thread)
+
+
+class TestMCTS(TestCase):
+    # the only move of the king captures both red men and wins
+    POSITION = BitBoard(white_kings=1 << square_index(7, 0), red_men=1 << square_index(5, 2) | 1 << square_index(2, 5))
+
+    def test_finds_winning_capture_and_reuses_tree(self):
+        mcts = MCTS(seed=1)
+        result = mcts.search(BitBoard.initial(), Player.white, playouts=200)
+        self.assertEqual(200, result.playouts)
+        self.assertEqual(200, sum(result.visits.values()))
+
+        reply = mcts.root.position.generate(Player.red)[0]
+        child = mcts.root.position.apply(reply, Player.red)
+        reused = [c for c in mcts.root.children if c.position == child]
+        visits = reused[0].visits if reused else 0
+
+        mcts.search(child, Player.white, playouts=100)
+        self.assertEqual(visits + 100, mcts.root.parent.visits)
+
+        for mcts in (MCTS(seed=2), MCTS(seed=3, batch_size=8)):
+            result = mcts.search(self.POSITION, Player.white, playouts=200)
+            self.assertEqual((square_index(5, 2), square_index(2, 5)), result.move[1])
+            self.assertGreater(result.value, 0.9)
+
+    def test_parallel_search(self):
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            result = parallel_search(executor, 2, self.POSITION, Player.white, playouts=200)
+
+        self.assertEqual(200, result.playouts)
+        self.assertEqual(2, len(result.move[1]))
+
+
+class TestBatchBoard(TestCase):
+    def test_matches_bitboard(self):
+        rnd = random.Random(11)
+        positions = []
+        for _ in range(40):
+            position, player = BitBoard.initial(), Player.white
+            for _ in range(rnd.randrange(100)):
+                moves = position.generate(player)
+                if not moves:
+                    break
+                position, player = position.apply(rnd.choice(moves), player), player.opponent
+            positions.append((position, player))
+
+        batch = BatchBoard.from_positions(positions)
+        flags, quiet = batch.capture_flags(), batch.quiet_moves()
+
+        for i, (position, player) in enumerate(positions):
+            moves = position.generate(player)
+            is_capture = bool(moves) and bool(moves[0][1])
+            self.assertEqual(is_capture, flags[i])
+            if not is_capture:
+                self.assertEqual(len(moves), quiet[i].sum())
+
+    def test_play_out_finishes_games(self):
+        result = play_out(BatchBoard.initial(20), np.random.RandomState(0), max_plies=300)
+
+        self.assertEqual(20, np.count_nonzero(result))
+
+
+class TestMovesCache(TestCase):
+    def test_cached_moves_match_generated(self):
+        rnd = random.Random(13)
+        cache = MovesCache(size=50)
+        game, cached_game = Game(), Game(cache=cache)
+
+        with game:
+            for _ in range(100):
+                all_moves = game.get_possible_moves()
+                self.assertEqual(_flatten(all_moves), _flatten(cached_game.get_possible_moves()))
+                self.assertEqual(_flatten(all_moves), _flatten(cached_game.get_possible_moves()))
+
+                move = rnd.choice([m for moves in all_moves.values() for m in moves])
+                cached_game.move(_same_move(cached_game, move))
+                game.move(move)
+
+        self.assertGreater(cache.hits, cache.misses)
+        self.assertLessEqual(len(cache), 50)
+
+
+class TestTablebase(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.directory = tempfile.TemporaryDirectory()
+        build(cls.directory.name, max_pieces=2, progress=None)
+        cls.tablebase = Tablebase(cls.directory.name)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.tablebase.close()
+        cls.directory.cleanup()
+
+    def test_results_agree_with_successors(self):
+        for signature in signatures(2):
+            for position in _positions(signature):
+                for player in Player:
+                    result, distance = self.tablebase.probe(position, player)
+                    children = [self.tablebase.probe(position.apply(move, player), player.opponent)
+                                for move in position.generate(player)]
+
+                    if result == TABLE_WIN:
+                        self.assertIn((TABLE_LOSS, distance - 1), children)
+                        self.assertFalse([c for c in children if c[0] == TABLE_LOSS and c[1] < distance - 1])
+                    elif result == TABLE_LOSS:
+                        self.assertTrue(all(c[0] == TABLE_WIN for c in children))
+                        self.assertEqual(distance - 1, max([c[1] for c in children], default=-1))
+                    else:
+                        self.assertIn(DRAW, [c[0] for c in children])
+                        self.assertNotIn(TABLE_LOSS, [c[0] for c in children])
+
+    def test_game_is_adjudicated(self):
+        drawn, won = BoardLayout(f01='wK', f76='rK'), BoardLayout(f23='wK', f34='rP')
+        for layout, winner in ((drawn, None), (won, Player.white)):
+            game = Game(tablebase=self.tablebase)
+            game.board = TailoredBoard(layout)
+
+            with game:
+                game.get_possible_moves()
+
+            self.assertFalse(game.continues())
+            self.assertEqual(winner, game.winner)
+
+    def test_searcher_scores_distance_to_win(self):
+        position = BitBoard(white_kings=1 << square_index(0, 1), red_men=1 << square_index(5, 2))
+
+        result = Searcher(tablebase=self.tablebase).search_position(position, Player.white, depth=2)
+
+        self.assertEqual((TABLE_WIN, 7), self.tablebase.probe(position, Player.white))
+        self.assertEqual(WIN - 7, result.score)
+
+
+class TestRecords(TestCase):
+    @staticmethod
+    def _random_games(n, plies=60):
+        rnd = random.Random(17)
+        games = []
+        for _ in range(n):
+            position, player, moves, positions = BitBoard.initial(), Player.white, [], []
+            for _ in range(plies):
+                positions.append((position, player))
+                all_moves = position.generate(player)
+                if not all_moves:
+                    break
+                move = rnd.choice(all_moves)
+                moves.append(move)
+                position, player = position.apply(move, player), player.opponent
+            games.append((moves, positions))
+        return games
+
+    def test_position_round_trip(self):
+        for _, positions in self._random_games(3):
+            for position, player in positions:
+                data = to_bytes(position, player)
+                self.assertEqual(POSITION.size, len(data))
+                self.assertEqual((position, player), from_bytes(data))
+                self.assertEqual((position, player), from_fen(to_fen(position, player)))
+                self.assertEqual(list(position.masks()), Board.from_masks(position.masks()).masks)
+
+        self.assertEqual("W:W1,2,3,4,5,6,7,8,9,10,11,12:R21,22,23,24,25,26,27,28,29,30,31,32",
+                         to_fen(Board(), Player.white))
+        self.assertRaises(ValueError, from_fen, "W:W33:R1")
+
+    def test_game_store_random_access(self):
+        games = self._random_games(5)
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'games.bin')
+            with GameStore(path) as store:
+                for moves, _ in games[:3]:
+                    store.append(moves)
+
+            with GameStore(path) as store:
+                for moves, _ in games[3:]:
+                    store.append(moves)
+
+                self.assertEqual(len(games), len(store))
+                for k, (moves, positions) in enumerate(games):
+                    self.assertEqual([move[0] for move in moves], store.moves(k))
+                    for ply in (0, len(positions) // 2, len(positions) - 1):
+                        self.assertEqual(positions[ply], store.position(k, ply))
+
+    def test_game_moves_are_stored(self):
+        rnd = random.Random(5)
+        game = Game()
+        with game:
+            for _ in range(40):
+                game.play(rnd.choice([m for moves in game.get_possible_moves().values() for m in moves]))
+
+        with tempfile.TemporaryDirectory() as directory:
+            with GameStore(os.path.join(directory, 'games.bin')) as store:
+                k = store.append_game(game)
+                position, player = store.position(k, len(store.moves(k)))
+
+        self.assertEqual(BitBoard.from_board(game.board), position)
+        self.assertEqual(game.current_player, player)
+
+    def test_games_from_other_positions(self):
+        rnd = random.Random(9)
+        game = Game()
+        game.board = TailoredBoard(BoardLayout(f23='wK', f21='wP', f34='rP', f70='rP', f76='rK'))
+        start = BitBoard.from_board(game.board)
+        with game:
+            for _ in range(6):
+                game.play(rnd.choice([m for moves in game.get_possible_moves().values() for m in moves]))
+
+        international = Game(size=10, starting_rows=4)
+        international.play(next(iter(international.get_possible_moves().values()))[0])
+
+        with tempfile.TemporaryDirectory() as directory:
+            with GameStore(os.path.join(directory, 'games.bin')) as store:
+                k = store.append_game(game)
+                self.assertEqual((start, Player.white), store.start(k))
+                positions = list(store.positions(k))
+                self.assertRaises(ValueError, store.append_game, international)
+                self.assertEqual(1, len(store))
+
+        self.assertEqual(len(game.moves()) + 1, len(positions))
+        self.assertEqual((BitBoard.from_board(game.board), game.current_player), positions[-1])
+
+
+class TestPDN(TestCase):
+    def test_written_games_are_read_back(self):
+        records = [({'Round': i}, [move[0] for move in moves]) for i, (moves, _) in
+                   enumerate(TestRecords._random_games(4))]
+        f = io.StringIO()
+        write_games(f, records)
+        f.seek(0)
+
+        games = list(read_games(f))
+
+        self.assertEqual([moves for _, moves in records], [moves for _, moves in games])
+        self.assertEqual(['0', '1', '2', '3'], [headers['Round'] for headers, _ in games])
+
+    def test_comments_variations_and_short_captures(self):
+        text = '[Event "test"]\n1. 11-15 {a comment\n over lines} 22-18 (22-17 $1) 2. 15x22 ; capture\n' \
+               '25x18 1/2-1/2\n\n[Event "illegal"]\n1. 11-16 9-13 *\n'
+        games = read_games(io.StringIO(text))
+
+        headers, moves = next(games)
+        self.assertEqual('test', headers['Event'])
+        self.assertEqual([(10, 14), (21, 17), (14, 21), (24, 17)], moves)
+        self.assertRaises(PDNError, next, games)
+
+    def test_game_from_fen_is_written_back(self):
+        text = '[FEN "W:BK2,18:W23,26"]\n[Result "*"]\n1... 23x14 2. 2-7 26-22 *\n'
+        headers, moves = next(read_games(io.StringIO(text)))
+
+        f = io.StringIO()
+        write_games(f, [(headers, moves)])
+        f.seek(0)
+        self.assertEqual([(headers, moves)], list(read_games(f)))
+
+        self.assertRaises(PDNError, write_games, io.StringIO(), [(headers, [(17, 13)])])
+
+
+class TestOpeningBook(TestCase):
+    def test_statistics_and_probes(self):
+        records = [({'Result': '1-0'}, [(8, 12), (21, 17)]), ({'Result': '0-1'}, [(8, 12), (22, 17)]),
+                   ({'Result': '1/2-1/2'}, [(9, 13)]), ({}, [(8, 12)])]
+
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'book.bin')
+            self.assertEqual(4, build_book(records, path))
+
+            with OpeningBook(path) as book:
+                first = book.probe(BitBoard.initial(), Player.white)
+                self.assertEqual([(8, 12), (9, 13)], [m.path for m in first])
+                self.assertEqual((3, 1, 0, 1), (first[0].games, first[0].wins, first[0].draws, first[0].losses))
+                self.assertEqual(0.5, first[1].score)
+
+                after = BitBoard.initial().apply(((8, 12), ()), Player.white)
+                self.assertEqual([(21, 17), (22, 17)], sorted(m.path for m in book.probe(after, Player.red)))
+                self.assertEqual([], book.probe(after, Player.white))
+
+                result = Searcher(book=book).search_position(BitBoard.initial(), Player.white)
+                self.assertEqual(((8, 12), ()), result.path)
+                self.assertEqual(0, result.nodes)
+
+                moves = book.probe_game(Game())
+                self.assertEqual([(8, 12), (9, 13)], [move.path[0] for move, _ in moves])
+
+
+class TestInstrumentation(TestCase):
+    def test_measure_game(self):
+        board = TailoredBoard(BoardLayout(f12='wP', f23='rP', f43='rP', f63='rP'))
+
+        with measure() as metrics:
+            wrapper = MovesGenerator.generate
+            with Game() as game:
+                game.board = board
+                game.play(game.get_possible_moves()[board()[1, 2]][0])
+                game.board.clone()
+
+        # wrappers stay in place, not stacked by later measurements, and record nothing outside of them
+        game.board.clone()
+        with measure():
+            self.assertIs(wrapper, MovesGenerator.generate)
+        self.assertEqual(1, metrics['moves_generator.generate'].count)
+        self.assertEqual(3, metrics['game.move'].count)
+        self.assertEqual(1, metrics['board.clone'].count)
+        self.assertEqual(3, metrics['capture_tree.depth'].maximum)
+        self.assertEqual(4, metrics['capture_tree.nodes'].maximum)
+        self.assertIn('checkers_game_move_seconds_count 3', metrics.to_prometheus())
+        self.assertEqual(3, metrics.snapshot()['game.move']['count'])
+
+    def test_measurements_are_scoped_to_thread(self):
+        def play(moves):
+            with measure() as metrics:
+                game = Game()
+                for _ in range(moves):
+                    game.play(next(iter(game.get_possible_moves().values()))[0])
+            return metrics
+
+        with measure() as outer:
+            with ThreadPoolExecutor(2) as executor:
+                counts = [m['game.move'].count for m in executor.map(play, (2, 3, 4))]
+            Game().board.clone()
+
+        self.assertEqual([2, 3, 4], counts)
+        self.assertNotIn('game.move', outer)
+        self.assertEqual(1, outer['board.clone'].count)
+
+
+class TestPerft(TestCase):
+    def test_baseline_of_another_backend_is_reported(self):
+        results = {'start': {'1': {'nodes': 7, 'time': 1.0, 'nps': 7.0}}}
+        baseline = {'backend': 'objects', 'results': {'start': {'1': {'nodes': 7, 'time': 1.0, 'nps': 70.0}}}}
+
+        self.assertEqual(1, len(perft_compare(results, baseline, 0.2, 'objects')))
+        failures = perft_compare(results, baseline, 0.2, 'native')
+        self.assertEqual(1, len(failures))
+        self.assertIn('native', failures[0])
+
+
+def _perft(game, depth):
+    if depth == 0:
+        return 1
+    try:
+        all_moves = game.get_possible_moves()
+    except EndGameEvent:
+        return 0
+
+    nodes = 0
+    for move in (m for moves in all_moves.values() for m in moves):
+        steps = list(_steps(move))
+        for step in steps:
+            game.move(step)
+        nodes += _perft(game, depth - 1)
+        for _ in steps:
+            game.undo()
+    return nodes
+
+
+def _native_perft(position, player, depth):
+    if depth == 0:
+        return 1
+    return sum(_native_perft(position.apply(move, player), player.opponent, depth - 1)
+               for move in position.generate(player))
+
+
+def _steps(move):
+    while move is not None:
+        yield move
+        move = move.following_move
+
+
+def _same_move(game, move):
+    for moves in game.get_possible_moves().values():
+        for m in moves:
+            if m.path == move.path:
+                return m
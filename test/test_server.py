@@ -0,0 +1,124 @@
+import asyncio
+import json
+from unittest import TestCase
+
+import server
+from model.bitboard import BitBoard
+from server import GameServer
+
+
+class TestGameServer(TestCase):
+    def setUp(self):
+        self.server = GameServer(workers=1)
+
+    def tearDown(self):
+        self.server.close()
+
+    def test_game_against_computer(self):
+        async def play():
+            state = await self.server.handle({'op': 'new', 'opponent': 'random'})
+            session = state['session']
+
+            while state['moves']:
+                self.assertEqual('white', state['player'])
+                state = await self.server.handle({'op': 'move', 'session': session, 'move': state['moves'][-1]})
+                self.assertTrue(state['reply'] or state['finished'])
+            return session, state
+
+        session, state = asyncio.run(play())
+
+        self.assertTrue(state['finished'])
+        self.assertIn(state['winner'], ('white', 'red'))
+        self.assertIn(session, self.server.sessions)
+
+    def test_errors_are_responses(self):
+        class Writer:
+            def __init__(self):
+                self.lines = []
+
+            def write(self, data):
+                self.lines.append(json.loads(data))
+
+            async def drain(self):
+                pass
+
+        async def respond():
+            writer = Writer()
+            state = await self.server.handle({'op': 'new'})
+            for line in ('not json', '{"id": 1, "op": "state", "session": "unknown"}',
+                         json.dumps({'id': 2, 'op': 'move', 'session': state['session'], 'move': '1-5'}),
+                         json.dumps({'id': 3, 'op': 'move', 'session': state['session'], 'move': '9-13'})):
+                await self.server._respond(line.encode(), writer)
+            return writer.lines
+
+        responses = asyncio.run(respond())
+
+        self.assertEqual([False, False, False, True], [r['ok'] for r in responses])
+        self.assertEqual([None, 1, 2, 3], [r['id'] for r in responses])
+        self.assertEqual('red', responses[-1]['player'])
+
+    def test_invalid_players_are_protocol_errors(self):
+        class Writer:
+            def __init__(self):
+                self.lines = []
+
+            def write(self, data):
+                self.lines.append(json.loads(data))
+
+            async def drain(self):
+                pass
+
+        async def respond():
+            writer = Writer()
+            for opponent in ('mcts:100:foo', 'search:1:0', 5):
+                await self.server._respond(json.dumps({'op': 'new', 'opponent': opponent}).encode(), writer)
+            return writer.lines
+
+        responses = asyncio.run(respond())
+
+        self.assertEqual([False] * 3, [r['ok'] for r in responses])
+        self.assertEqual("Unknown policy: foo", responses[0]['error'])
+        self.assertFalse(any('Internal' in r['error'] for r in responses))
+        self.assertEqual({}, self.server.sessions)
+
+    def test_sessions_are_closed_with_connection(self):
+        class Reader:
+            def __init__(self, lines):
+                self.lines = lines
+
+            async def readline(self):
+                return self.lines.pop(0) if self.lines else b''
+
+        class Writer:
+            def write(self, data):
+                pass
+
+            async def drain(self):
+                pass
+
+            def close(self):
+                pass
+
+        async def connect():
+            other = await self.server.handle({'op': 'new'})
+            await self.server.handle_connection(Reader([b'{"op": "new"}\n', b'{"op": "new"}\n']), Writer())
+            return other['session']
+
+        other = asyncio.run(connect())
+
+        self.assertEqual([other], list(self.server.sessions))
+
+    def test_players_of_worker_are_bounded(self):
+        masks = BitBoard.initial().masks()
+        specs = [f'mcts:{playouts}' for playouts in range(10, server.MAX_PLAYERS + 12)]
+        try:
+            for spec in specs:
+                server.think(spec, masks, False)
+            self.assertEqual(specs[-server.MAX_PLAYERS:], list(server._players))
+
+            server.think(specs[-server.MAX_PLAYERS], masks, False)
+            server.think('random', masks, False)
+            self.assertNotIn(specs[-server.MAX_PLAYERS + 1], server._players)
+        finally:
+            server._close_players()
+        self.assertEqual({}, server._players)
@@ -0,0 +1,153 @@
+"""
+Headless self-play tournament between two computer players, spread over a process pool.
+Players alternate colours, records of finished games are appended to the output as JSON lines.
+
+    python tournament.py random search:3 -n 200 -o results.jsonl
+    python tournament.py greedy search:0.1s -n 50 -w 4 --chunk-size 5
+    python tournament.py search:4 search:6 --tablebase tables --book book.bin
+"""
+import argparse
+import json
+import sys
+import time
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from model.bitboard import BitboardMovesGenerator
+from model.book import OpeningBook
+from model.game import Game
+from model.items import Player
+from model.players import create_player
+from model.tablebase import Tablebase
+
+MAX_PLIES = 300
+
+
+def play_game(index, white, red, seed, max_plies=MAX_PLIES, tablebase=None, book=None):
+    """
+    Play one game. A ply is a complete move, the game is a draw after max_plies
+    or when a position repeats for the third time.
+    :param tablebase: directory of model.tablebase tables, the game is adjudicated as soon as they know its result.
+    :param book: model.book file used by search players.
+    :return: dict record of the game.
+    """
+    tables = Tablebase(tablebase) if tablebase else None
+    opening_book = OpeningBook(book) if book else None
+    game = Game(BitboardMovesGenerator, tablebase=tables)
+    players = {}
+
+    plies = 0
+    start = time.perf_counter()
+    try:
+        players[Player.white] = create_player(white, seed, opening_book)
+        players[Player.red] = create_player(red, seed + 1, opening_book)
+        repetitions = Counter([game.board.key])
+
+        with game:
+            while game.continues() and plies < max_plies:
+                move = players[game.current_player].choose(game)
+                game.play(move)
+                plies += 1
+
+                repetitions[game.board.key] += 1
+                if repetitions[game.board.key] >= 3:
+                    break
+    finally:
+        for player in players.values():
+            player.close()
+        if opening_book:
+            opening_book.close()
+        if tables:
+            tables.close()
+
+    return {'game': index, 'white': white, 'red': red, 'seed': seed,
+            'winner': game.winner.name if game.winner else None, 'plies': plies,
+            'nodes': {player.name: players[player].nodes for player in Player},
+            'elapsed': time.perf_counter() - start}
+
+
+def play_chunk(tasks):
+    return [play_game(*task) for task in tasks]
+
+
+def schedule(player_a, player_b, games, seed=0, max_plies=MAX_PLIES, tablebase=None, book=None):
+    """Tasks of play_game, player_a is white in even games and red in odd games."""
+    tasks = []
+    for i in range(games):
+        white, red = (player_a, player_b) if i % 2 == 0 else (player_b, player_a)
+        tasks.append((i, white, red, seed + 2 * i, max_plies, tablebase, book))
+    return tasks
+
+
+def run(player_a, player_b, games, workers=None, chunk_size=4, output=None, seed=0, max_plies=MAX_PLIES,
+        tablebase=None, book=None):
+    """
+    Play the tournament, records are written to output as soon as their chunk is finished.
+    :return: summary dict, wins and losses are counted for player_a.
+    """
+    tasks = schedule(player_a, player_b, games, seed, max_plies, tablebase, book)
+    chunks = [tasks[i:i + chunk_size] for i in range(0, len(tasks), chunk_size)]
+    summary = {'player_a': player_a, 'player_b': player_b, 'wins': 0, 'losses': 0, 'draws': 0,
+               'plies': [], 'nodes': 0}
+
+    out = open(output, 'a') if output else None
+    try:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            futures = [executor.submit(play_chunk, chunk) for chunk in chunks]
+            for future in as_completed(futures):
+                for record in future.result():
+                    _add_to_summary(summary, record)
+                    if out:
+                        out.write(json.dumps(record) + "\n")
+                if out:
+                    out.flush()
+    finally:
+        if out:
+            out.close()
+
+    return summary
+
+
+def _add_to_summary(summary, record):
+    # player_a is white in even games, see schedule(), the specs may be the same
+    player_a = Player.white if record['game'] % 2 == 0 else Player.red
+    if record['winner'] is None:
+        summary['draws'] += 1
+    elif record['winner'] == player_a.name:
+        summary['wins'] += 1
+    else:
+        summary['losses'] += 1
+
+    summary['plies'].append(record['plies'])
+    summary['nodes'] += sum(record['nodes'].values())
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Play computer players against each other.")
+    parser.add_argument('player_a', help="random, greedy, search:<depth> or search:<seconds>s")
+    parser.add_argument('player_b')
+    parser.add_argument('-n', '--games', type=int, default=10)
+    parser.add_argument('-w', '--workers', type=int, default=None, help="processes, all cores by default")
+    parser.add_argument('--chunk-size', type=int, default=4, help="games sent to a worker at once")
+    parser.add_argument('--max-plies', type=int, default=MAX_PLIES)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('-o', '--output', help="JSON lines file the game records are appended to")
+    parser.add_argument('--tablebase', help="directory of endgame tables built with build_tablebase.py")
+    parser.add_argument('--book', help="opening book built with build_book.py")
+    args = parser.parse_args(argv)
+
+    start = time.perf_counter()
+    summary = run(args.player_a, args.player_b, args.games, args.workers, args.chunk_size, args.output,
+                  args.seed, args.max_plies, args.tablebase, args.book)
+    elapsed = time.perf_counter() - start
+
+    plies = summary['plies']
+    print(f"{summary['player_a']} vs {summary['player_b']}: "
+          f"+{summary['wins']} -{summary['losses']} ={summary['draws']}")
+    print(f"average length: {sum(plies) / max(len(plies), 1):.1f} plies, "
+          f"nodes: {summary['nodes']}, time: {elapsed:.1f} s")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())